@@ -0,0 +1,174 @@
+import threading
+import time
+
+
+def _minutes_of_day(hhmm):
+    """'08:25' -> 505. Returns None for blank or malformed timetable values."""
+    try:
+        h, m = hhmm.strip().split(":")[:2]
+        return int(h) * 60 + int(m)
+    except (AttributeError, ValueError):
+        return None
+
+
+class ArrivalIndex:
+    """
+    Stop-centric index for "next arrivals at stop X".
+
+    Static part (rebuilt lazily after admin writes):
+      stop_id -> stop meta, stop_id -> services serving it,
+      stop_id -> timetable entries sorted by minute of day.
+    Live part (maintained on every accepted fix):
+      stop_id -> {service_no: predicted arrival} for every stop still ahead of the bus.
+    """
+
+    def __init__(self, live_max_age=600, overdue_grace=120):
+        self.live_max_age = live_max_age
+        self.overdue_grace = overdue_grace
+        self._lock = threading.Lock()
+        self.ready = False
+        self._stops = {}           # stop_id -> {"stop_id", "stop_name", "route_id", "lat", "lng"}
+        self._by_name = {}         # lower stop_name -> [stop_id]
+        self._services = {}        # stop_id -> set(service_no)
+        self._scheduled = {}       # stop_id -> [(minute_of_day, "HH:MM", service_no)]
+        self._live = {}            # stop_id -> {service_no: prediction}
+        self._bus_stops = {}       # vehicle_id -> [stop_id] currently predicted for that bus
+
+    # ── Static index ──
+    def build(self, stops, route_services, timetable):
+        """
+        stops: iterable of (stop_id, route_id, stop_name, lat, lng)
+        route_services: iterable of (route_id, service_no)
+        timetable: iterable of (stop_id, service_no, arrival_time)
+        """
+        by_route = {}
+        for route_id, service_no in route_services:
+            by_route.setdefault(route_id, set()).add(service_no)
+
+        stop_meta, by_name, services, scheduled = {}, {}, {}, {}
+        for stop_id, route_id, stop_name, lat, lng in stops:
+            stop_meta[stop_id] = {"stop_id": stop_id, "stop_name": stop_name, "route_id": route_id,
+                                  "lat": lat, "lng": lng}
+            by_name.setdefault(stop_name.lower(), []).append(stop_id)
+            services[stop_id] = set(by_route.get(route_id, ()))
+
+        for stop_id, service_no, arrival_time in timetable:
+            minute = _minutes_of_day(arrival_time)
+            if stop_id not in stop_meta or minute is None:
+                continue
+            services[stop_id].add(service_no)
+            scheduled.setdefault(stop_id, []).append((minute, arrival_time, service_no))
+        for entries in scheduled.values():
+            entries.sort()
+
+        with self._lock:
+            self._stops = stop_meta
+            self._by_name = by_name
+            self._services = services
+            self._scheduled = scheduled
+            self._live = {}
+            self._bus_stops = {}
+            self.ready = True
+
+    def invalidate(self):
+        with self._lock:
+            self.ready = False
+
+    def stop_ids_for(self, stop_name):
+        return list(self._by_name.get(stop_name.strip().lower(), ()))
+
+    def stop(self, stop_id):
+        return self._stops.get(stop_id)
+
+    def services_at(self, stop_id):
+        return self._services.get(stop_id, set())
+
+    # ── Live maintenance ──
+    def on_fix(self, pos, geom, closest_idx, dist_to_closest, eta):
+        """
+        Refresh the predicted arrival of one bus at every stop still ahead of it
+        on its route, and drop predictions for stops it has passed.
+        eta(from_idx, lead_km, dest_idx, remaining_km) -> (minutes, source) is the
+        caller's ETA model, so the board agrees with the per-bus ETA endpoint.
+        """
+        if not self.ready:
+            return
+        seen_at = time.time()
+        base = geom.cum_km[closest_idx]
+        ahead = []
+        with self._lock:
+            for j in range(closest_idx, len(geom)):
+                remaining = dist_to_closest + (geom.cum_km[j] - base)
+                stop_id = geom.stop_ids[j]
+                eta_minutes, eta_source = eta(closest_idx, dist_to_closest, j, remaining)
+                self._live.setdefault(stop_id, {})[pos["service_no"]] = {
+                    "vehicle_id": pos["vehicle_id"],
+                    "eta_minutes": eta_minutes,
+                    "eta_source": eta_source,
+                    "remaining_distance_km": round(remaining, 2),
+                    "stops_away": j - closest_idx,
+                    "updated_at": pos["updated_at"],
+                    "seen_at": seen_at
+                }
+                ahead.append(stop_id)
+            ahead_set = set(ahead)
+            for stop_id in self._bus_stops.get(pos["vehicle_id"], ()):
+                if stop_id not in ahead_set:
+                    self._live.get(stop_id, {}).pop(pos["service_no"], None)
+            self._bus_stops[pos["vehicle_id"]] = ahead
+
+    # ── Query ──
+    def arrivals(self, stop_ids, now=None, limit=10):
+        """
+        Upcoming arrivals at the given stop(s), merging live predictions with the
+        timetable. A service with a fresh live prediction is reported once as
+        "live" (with its next scheduled time attached); otherwise its remaining
+        timetable entries for today are reported as "scheduled".
+        Live ETAs count down from the fix they were computed at; a prediction more
+        than overdue_grace seconds past its ETA is dropped as stale.
+        """
+        now = now or time.time()
+        lt = time.localtime(now)
+        now_minute = lt.tm_hour * 60 + lt.tm_min
+
+        results = []
+        live_services = set()
+        for stop_id in stop_ids:
+            for service_no, pred in list(self._live.get(stop_id, {}).items()):
+                elapsed = now - pred["seen_at"]
+                if elapsed > self.live_max_age or elapsed > pred["eta_minutes"] * 60 + self.overdue_grace:
+                    continue
+                live_services.add(service_no)
+                results.append({
+                    "stop_id": stop_id,
+                    "service_no": service_no,
+                    "source": "live",
+                    "vehicle_id": pred["vehicle_id"],
+                    "eta_minutes": max(round(pred["eta_minutes"] - elapsed / 60), 0),
+                    "eta_source": pred["eta_source"],
+                    "remaining_distance_km": pred["remaining_distance_km"],
+                    "stops_away": pred["stops_away"],
+                    "updated_at": pred["updated_at"],
+                    "scheduled_time": self._next_scheduled(stop_id, service_no, now_minute)
+                })
+
+        for stop_id in stop_ids:
+            for minute, arrival_time, service_no in self._scheduled.get(stop_id, ()):
+                if minute < now_minute or service_no in live_services:
+                    continue
+                results.append({
+                    "stop_id": stop_id,
+                    "service_no": service_no,
+                    "source": "scheduled",
+                    "eta_minutes": minute - now_minute,
+                    "scheduled_time": arrival_time
+                })
+
+        results.sort(key=lambda r: r["eta_minutes"])
+        return results[:limit]
+
+    def _next_scheduled(self, stop_id, service_no, now_minute):
+        for minute, arrival_time, sno in self._scheduled.get(stop_id, ()):
+            if sno == service_no and minute >= now_minute:
+                return arrival_time
+        return None
@@ -1,19 +1,40 @@
 import os
-import math
-from flask import Flask, jsonify, request, render_template, session, redirect, url_for
+from flask import Flask, Response, jsonify, request, render_template, session, redirect, url_for, g
 from flask_cors import CORS
 from flask_caching import Cache
+from flask_socketio import SocketIO, join_room, leave_room
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.middleware.proxy_fix import ProxyFix
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+import math
 import time
+import queue
 import threading
+import atexit
 from dotenv import load_dotenv
 from flask_talisman import Talisman
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, true
+from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import IntegrityError
 from models import db, Route, Service, Vehicle, Stop, TimetableEntry, Driver, User, LiveLocation
+from live_store import LiveStore
+from geo import haversine, nearest_points
+from route_geometry import RouteGeometryCache
+from arrival_board import ArrivalIndex
+from spatial_index import GridIndex
+from station_index import StationIndex
+from fix_log import FixLog
+from gps_filter import FixFilter, ACCEPT
+from report_policy import ReportPolicy
+import fix_codec
+from delta_stream import DeltaStream, DELTA_SCALE
+from sse_broker import SSEBroker
+from data_versions import DataVersions
+from single_flight import SingleFlight
+from dashboard_counters import DashboardCounters
+from travel_model import TravelTimeModel, aggregate_segment_times, merge_samples
 
 load_dotenv()
 
@@ -22,9 +43,15 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 Talisman(app, content_security_policy=None, force_https=False)
 limiter = Limiter(get_remote_address, app=app, default_limits=["200 per day", "50 per hour"])
 
+# CACHE_BACKEND=shared adds a file cache under CACHE_DIR, shared by every gunicorn worker on
+# the host, behind each worker's in-memory L1 (see tiered_cache.py); "local" stays in-process.
+CACHE_SHARED = os.getenv("CACHE_BACKEND", "local") == "shared"
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(app.instance_path, "cache"))
 cache = Cache(app, config={
-    'CACHE_TYPE': 'SimpleCache',
-    'CACHE_DEFAULT_TIMEOUT': 300
+    'CACHE_TYPE': 'tiered_cache.TieredCache',
+    'CACHE_DEFAULT_TIMEOUT': 300,
+    'CACHE_DIR': CACHE_DIR if CACHE_SHARED else None,
+    'CACHE_L1_TIMEOUT': int(os.getenv("CACHE_L1_TIMEOUT", "60"))
 })
 
 app.secret_key = os.getenv("SECRET_KEY", "fallback_dev_key")
@@ -60,15 +87,386 @@ db.init_app(app)
 
 CORS(app)
 
-# ─── Haversine Distance Helper ─────────────────────────
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculate distance in km between two lat/lng points."""
-    R = 6371.0
-    dLat = math.radians(lat2 - lat1)
-    dLon = math.radians(lon2 - lon1)
-    a = math.sin(dLat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+# ─── Socket.IO Broker ──────────────────────────────────
+# async_mode is auto-detected (gevent under the GeventWebSocketWorker, threading
+# under the dev server). Clients that cannot upgrade stay on long-polling.
+# Set SOCKETIO_MESSAGE_QUEUE (e.g. redis://...) when running more than one worker.
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode=os.getenv("SOCKETIO_ASYNC_MODE") or None,
+    message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE") or None,
+)
+
+# ─── Live Position Store (write-behind to live_location) ─
+# LIVE_FLUSH_INTERVAL=0 turns write-behind off and commits every fix inline. With several
+# workers (CACHE_BACKEND=shared) each re-reads live_location every LIVE_STORE_SYNC_S seconds
+# to pick up fixes sent to the others.
+live_store = LiveStore(flush_interval=float(os.getenv("LIVE_FLUSH_INTERVAL", "5")),
+                       sync_interval=float(os.getenv("LIVE_STORE_SYNC_S", "5" if CACHE_SHARED else "0")))
+
+def flush_live_store():
+    """Persist pending fixes to live_location in a single transaction."""
+    batch = live_store.drain_dirty()
+    if not batch:
+        return 0
+    with app.app_context():
+        try:
+            ids = [p["vehicle_id"] for p in batch]
+            existing = {loc.bus_id: loc for loc in LiveLocation.query.filter(LiveLocation.bus_id.in_(ids)).all()}
+            for p in batch:
+                loc = existing.get(p["vehicle_id"])
+                if loc and (loc.updated_at or "") > p["updated_at"]:
+                    continue  # another worker already stored a newer fix
+                if loc:
+                    loc.lat = p["lat"]
+                    loc.lng = p["lng"]
+                    loc.speed = p["speed"]
+                    loc.updated_at = p["updated_at"]
+                else:
+                    db.session.add(LiveLocation(bus_id=p["vehicle_id"], lat=p["lat"], lng=p["lng"],
+                                                speed=p["speed"], updated_at=p["updated_at"]))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            live_store.requeue(batch)
+            print(f"[LIVE] Flush of {len(batch)} fix(es) failed: {e}", flush=True)
+            return 0
+    return len(batch)
+
+# ─── Location History (append-only fix log) ───────────
+fix_log = FixLog(
+    os.getenv("FIX_LOG_DIR", os.path.join(app.instance_path, "fix_log")),
+    retention_days=int(os.getenv("FIX_LOG_RETENTION_DAYS", "30"))
+)
+
+def flush_pending():
+    """Background flush: live positions to the DB, buffered history to disk."""
+    flush_live_store()
+    fix_log.flush()
+
+def schedule_flush():
+    """Write through when LIVE_FLUSH_INTERVAL=0, otherwise make sure the flusher is running."""
+    if live_store.flush_interval <= 0:
+        flush_pending()
+    else:
+        live_store.start_flusher(flush_pending, socketio.start_background_task, socketio.sleep)
+
+atexit.register(flush_pending)
+
+# ─── GPS Fix Filter (ingest) ───────────────────────────
+# Duplicate, jittery and physically impossible phone fixes are dropped before they
+# reach the store, the DB or the sockets. Accepted fixes are smoothed per vehicle.
+fix_filter = FixFilter(
+    alpha=float(os.getenv("FIX_FILTER_ALPHA", "0.6")),
+    beta=float(os.getenv("FIX_FILTER_BETA", "0.1")),
+    min_move_m=float(os.getenv("FIX_MIN_MOVE_M", "8")),
+    keepalive_s=float(os.getenv("FIX_KEEPALIVE_S", "60")),
+    max_speed_kmph=float(os.getenv("FIX_MAX_SPEED_KMPH", "120"))
+)
+
+def get_live_position(service_no):
+    """Latest fix for a service — from memory, falling back to live_location once."""
+    if live_store.sync_due():
+        ensure_live_store_warm()
+    pos = live_store.get_service(service_no)
+    if pos:
+        return pos
+    res = db.session.query(LiveLocation, Vehicle).join(Vehicle).join(Service).filter(Service.service_no == service_no).first()
+    if not res:
+        return None
+    loc, v = res
+    return live_store.put(service_no, v.vehicle_id, loc.lat, loc.lng, loc.speed, loc.updated_at, dirty=False)
+
+def ensure_live_store_warm():
+    """
+    Load every persisted live_location row into the store once per process, then
+    (LIVE_STORE_SYNC_S > 0) pick up fixes other workers received every LIVE_STORE_SYNC_S seconds.
+    """
+    if live_store.warmed and not live_store.sync_due():
+        return
+    rows = db.session.query(Service.service_no, LiveLocation.bus_id, LiveLocation.lat, LiveLocation.lng,
+                            LiveLocation.speed, LiveLocation.updated_at)\
+        .join(Vehicle, Vehicle.vehicle_id == LiveLocation.bus_id).join(Service).all()
+    live_store.mark_synced()
+    if not live_store.warmed:
+        live_store.warm(rows)
+        return
+    for service_no, vehicle_id, lat, lng, speed, updated_at in live_store.newer_rows(rows):
+        fix_filter.forget(vehicle_id)  # the track continued on another worker
+        store_position(service_no, vehicle_id, lat, lng, speed, updated_at, dirty=False)
+
+def resolve_vehicle_id(service_no):
+    """service_no -> vehicle_id, cached in the live store after the first lookup."""
+    vehicle_id = live_store.vehicle_for(service_no)
+    if vehicle_id is not None:
+        return vehicle_id
+    v = db.session.query(Vehicle).join(Service).filter(Service.service_no == service_no).first()
+    if not v:
+        return None
+    live_store.bind(service_no, v.vehicle_id)
+    return v.vehicle_id
+
+_service_ids = {}     # service_no <-> service_id, for the binary fix format
+
+def resolve_service_no(service_id):
+    service_no = _service_ids.get(service_id)
+    if service_no is None:
+        service_no = db.session.query(Service.service_no).filter(Service.service_id == service_id).scalar()
+        if service_no is not None:
+            _service_ids[service_id] = service_no
+            _service_ids[service_no] = service_id
+    return service_no
+
+def resolve_service_id(service_no):
+    service_id = _service_ids.get(service_no)
+    if service_id is None:
+        service_id = db.session.query(Service.service_id).filter(Service.service_no == service_no).scalar()
+        if service_id is not None:
+            _service_ids[service_no] = service_id
+            _service_ids[service_id] = service_no
+    return service_id
+
+
+# ─── Route Geometry Cache (ETA engine) ─────────────────
+route_geometry = RouteGeometryCache()
+
+def _load_route_stops(route_id):
+    return Stop.query.filter(Stop.route_id == route_id, Stop.lat.isnot(None), Stop.lng.isnot(None))\
+        .order_by(Stop.stop_order.asc()).all()
+
+def _load_service_route_id(service_no):
+    return db.session.query(Service.route_id).filter(Service.service_no == service_no).scalar()
+
+def get_service_geometry(service_no):
+    """Precomputed RouteGeometry for the route a service runs on, or None."""
+    route_id = route_geometry.route_for(service_no, _load_service_route_id)
+    if route_id is None:
+        return None
+    return route_geometry.get(route_id, _load_route_stops)
+
+
+# ─── Map Matching (along-route progress) ───────────────
+# Fixes further than OFF_ROUTE_KM from the polyline are not snapped. A backwards jump
+# smaller than ROUTE_RESET_KM is treated as GPS jitter and clamped; larger ones start a new trip.
+OFF_ROUTE_KM = float(os.getenv("OFF_ROUTE_KM", "0.5"))
+ROUTE_RESET_KM = float(os.getenv("ROUTE_RESET_KM", "1.0"))
+
+def match_to_route(geom, lat, lng, prev):
+    """
+    Route progress fields for a new fix: route_id, route_offset_km (monotonic within
+    a trip), route_seg and off_route. prev is the vehicle's previous stored position.
+    """
+    prev_offset = None
+    if prev and prev.get("route_id") == geom.route_id:
+        prev_offset = prev.get("route_offset_km")
+    snapped = geom.project(lat, lng, prev_offset)
+    if snapped is None or snapped[3] > OFF_ROUTE_KM:
+        return {"route_id": geom.route_id, "route_offset_km": prev_offset, "route_seg": None, "off_route": True}
+
+    seg, _, offset, _ = snapped
+    if prev_offset is not None and prev_offset - ROUTE_RESET_KM < offset < prev_offset:
+        offset = prev_offset
+    return {"route_id": geom.route_id, "route_offset_km": round(offset, 4), "route_seg": seg, "off_route": False}
+
+def route_progress(pos, geom):
+    """
+    (first stop still ahead, distance to it along the route) for a position —
+    from the map-matched offset when there is one, else the nearest stop.
+    """
+    offset = pos.get("route_offset_km")
+    if offset is None or pos.get("route_id") != geom.route_id:
+        return geom.nearest_stop(pos["lat"], pos["lng"])
+    idx = min(geom.next_stop_index(offset), len(geom) - 1)
+    return idx, max(geom.cum_km[idx] - offset, 0.0)
+
+
+# ─── Adaptive Reporting Rate (driver devices) ──────────
+# Every ingest response tells the phone when to report next; see ReportPolicy.
+report_policy = ReportPolicy(
+    min_interval_s=float(os.getenv("REPORT_MIN_INTERVAL_S", "3")),
+    max_interval_s=float(os.getenv("REPORT_MAX_INTERVAL_S", "15")),
+    parked_interval_s=float(os.getenv("REPORT_PARKED_INTERVAL_S", "30")),
+    near_stop_km=float(os.getenv("REPORT_NEAR_STOP_KM", "0.3")),
+    target_rate=float(os.getenv("REPORT_TARGET_FIXES_PER_S", "50"))
+)
+
+def report_advice(pos):
+    """Next reporting interval/distance for the device behind a stored position."""
+    if not pos:
+        return report_policy.advise(0)
+    geom = get_service_geometry(pos["service_no"])
+    stop_km = route_progress(pos, geom)[1] if geom else None
+    return report_policy.advise(pos.get("speed"), stop_km)
+
+
+# ─── Historical Travel-time Model (ETA blending) ───────
+# Rebuilt from the fix log every TRAVEL_MODEL_REFRESH_S seconds by a background job. Past day
+# partitions are aggregated once and kept in _travel_day_samples; each rebuild only reads
+# new days plus today's growing partition, yielding to other greenlets between partitions.
+# ETA_LIVE_WEIGHT is the share given to live speed once the bus moves at ETA_LIVE_FULL_SPEED km/h;
+# a stopped bus is predicted purely from history.
+travel_model = TravelTimeModel(bucket_minutes=int(os.getenv("TRAVEL_MODEL_BUCKET_MIN", "60")))
+TRAVEL_MODEL_DAYS = int(os.getenv("TRAVEL_MODEL_DAYS", "28"))
+TRAVEL_MODEL_REFRESH_S = int(os.getenv("TRAVEL_MODEL_REFRESH_S", str(6 * 3600)))
+ETA_LIVE_WEIGHT = float(os.getenv("ETA_LIVE_WEIGHT", "0.5"))
+ETA_LIVE_FULL_SPEED = float(os.getenv("ETA_LIVE_FULL_SPEED", "15"))
+_travel_model_job = {"started": False, "running": False}
+_travel_day_samples = {}   # "YYYY-MM-DD" -> samples from that (complete) day's partitions
+
+def rebuild_travel_model():
+    """Aggregate the last TRAVEL_MODEL_DAYS of history into segment travel times."""
+    with app.app_context():
+        fix_log.flush()
+        days = fix_log.days()[-TRAVEL_MODEL_DAYS:]
+        vehicle_routes = dict(db.session.query(Vehicle.vehicle_id, Service.route_id).join(Service).all())
+        geometries = {rid: route_geometry.get(rid, _load_route_stops)
+                      for rid in set(vehicle_routes.values()) if rid is not None}
+
+    today = time.strftime("%Y-%m-%d")
+    for day in list(_travel_day_samples):
+        if day not in days:
+            del _travel_day_samples[day]
+    parts = []
+    for day in days:
+        part = _travel_day_samples.get(day)
+        if part is None:
+            part = aggregate_segment_times(fix_log, [day], vehicle_routes, geometries, travel_model.bucket_minutes,
+                                           pause=lambda: socketio.sleep(0))
+            if day < today:
+                _travel_day_samples[day] = part
+        parts.append(part)
+    travel_model.build(merge_samples(parts), geometries)
+    print(f"[ETA] Travel-time model rebuilt: {travel_model.stats()}", flush=True)
+
+def run_travel_model_rebuild():
+    """Rebuild unless a rebuild is already running. Returns False if it was."""
+    if _travel_model_job["running"]:
+        return False
+    _travel_model_job["running"] = True
+    try:
+        rebuild_travel_model()
+    except Exception as e:
+        print(f"[ETA] Travel-time model rebuild failed: {e}", flush=True)
+    finally:
+        _travel_model_job["running"] = False
+    return True
+
+def ensure_travel_model_job():
+    """Start the periodic model rebuild once per process."""
+    if _travel_model_job["started"]:
+        return
+    _travel_model_job["started"] = True
+
+    def loop():
+        while True:
+            run_travel_model_rebuild()
+            socketio.sleep(TRAVEL_MODEL_REFRESH_S)
+
+    socketio.start_background_task(loop)
+
+
+# ─── Stop Arrival Index ────────────────────────────────
+# Live predictions older than ARRIVAL_LIVE_MAX_AGE seconds, or more than ARRIVAL_OVERDUE_GRACE
+# seconds past their ETA, are ignored on the board.
+arrival_index = ArrivalIndex(live_max_age=int(os.getenv("ARRIVAL_LIVE_MAX_AGE", "600")),
+                             overdue_grace=int(os.getenv("ARRIVAL_OVERDUE_GRACE", "120")))
+
+def arrival_eta(pos, geom):
+    """ETA function for ArrivalIndex.on_fix, using the same blend as /api/eta."""
+    def eta(from_idx, lead_km, dest_idx, remaining_km):
+        return blend_eta(pos["speed"], geom, from_idx, lead_km, dest_idx, remaining_km)
+    return eta
+
+def ensure_arrival_index():
+    """Build the stop -> services/timetable index once, then replay known bus positions into it."""
+    if live_store.sync_due():
+        ensure_live_store_warm()
+    if arrival_index.ready:
+        return
+    stops = db.session.query(Stop.stop_id, Stop.route_id, Stop.stop_name, Stop.lat, Stop.lng).all()
+    route_services = db.session.query(Service.route_id, Service.service_no).all()
+    timetable = db.session.query(TimetableEntry.stop_id, Service.service_no, TimetableEntry.arrival_time)\
+        .join(Service, Service.service_id == TimetableEntry.service_id).all()
+    arrival_index.build(stops, route_services, timetable)
+
+    ensure_live_store_warm()
+    for pos in live_store.all():
+        geom = get_service_geometry(pos["service_no"])
+        if geom:
+            arrival_index.on_fix(pos, geom, *route_progress(pos, geom), eta=arrival_eta(pos, geom))
+
+
+# ─── Stop Spatial Index (nearby stops) ─────────────────
+stop_grid = GridIndex(cell_deg=float(os.getenv("STOP_GRID_CELL_DEG", "0.01")))
+
+def _stop_grid_entry(st):
+    return (st.stop_id, st.lat, st.lng,
+            {"stop_id": st.stop_id, "stop_name": st.stop_name, "route_id": st.route_id, "lat": st.lat, "lng": st.lng})
+
+def ensure_stop_grid():
+    if stop_grid.ready:
+        return
+    stops = db.session.query(Stop.stop_id, Stop.stop_name, Stop.route_id, Stop.lat, Stop.lng)\
+        .filter(Stop.lat.isnot(None), Stop.lng.isnot(None)).all()
+    stop_grid.load(_stop_grid_entry(st) for st in stops)
+
+
+# ─── Station Name Indexes (search / autocomplete) ──────
+# station_index covers Route.from_station/to_station, stop_name_index covers Stop.stop_name.
+# Free text is resolved to canonical names here so SQL filters use IN (...) instead of ilike('%...%').
+station_index = StationIndex()
+stop_name_index = StationIndex()
+
+def ensure_station_index():
+    if station_index.ready:
+        return
+    rows = db.session.query(Route.from_station, Route.to_station).all()
+    station_index.load([name for pair in rows for name in pair])
+
+def ensure_stop_name_index():
+    if stop_name_index.ready:
+        return
+    stop_name_index.load([r[0] for r in db.session.query(Stop.stop_name).distinct().all()])
+
+def station_pair_condition(from_text, to_text):
+    """
+    Route filter matching either direction between two free-text stations,
+    or None if either side resolves to no station at all.
+    """
+    ensure_station_index()
+    from_names = station_index.resolve(from_text)
+    to_names = station_index.resolve(to_text)
+    if from_names == [] or to_names == []:
+        return None
+
+    def side(column, names):
+        return true() if names is None else column.in_(names)
+
+    return or_(
+        and_(side(Route.from_station, from_names), side(Route.to_station, to_names)),
+        and_(side(Route.from_station, to_names), side(Route.to_station, from_names))
+    )
+
+
+# ─── Moving-object Index (buses near me) ───────────────
+# Keyed by vehicle_id; ingest_fix moves a bus between buckets only when it crosses a cell.
+bus_grid = GridIndex(cell_deg=float(os.getenv("BUS_GRID_CELL_DEG", "0.01")))
+
+def ensure_bus_grid():
+    if live_store.sync_due():
+        ensure_live_store_warm()
+    if bus_grid.ready:
+        return
+    ensure_live_store_warm()
+    bus_grid.load((p["vehicle_id"], p["lat"], p["lng"], p) for p in live_store.all())
+
+def fix_age_seconds(updated_at, now=None):
+    """Seconds since an updated_at string ('%Y-%m-%d %H:%M:%S', server local time)."""
+    try:
+        return (now or time.time()) - time.mktime(time.strptime(updated_at, "%Y-%m-%d %H:%M:%S"))
+    except (TypeError, ValueError):
+        return float('inf')
 
 
 @app.route("/api/admin/force_seed")
@@ -89,6 +487,8 @@ def force_seed():
     d3 = Driver(username='driver_400k', password=generate_password_hash('pass400k'))
     db.session.add_all([d1, d2, d3])
     db.session.commit()
+    dashboard_counters.invalidate_all()
+    data_changed(*DATA_ENTITIES)
     return "Database forcefully completely wiped, re-initialized and powerfully re-seeded with exactly 3 Drivers!"
 
 # ─── Admin Auth Helpers ─────────────────────────────────
@@ -109,6 +509,140 @@ def admin_required(f):
     return decorated
 
 
+# ─── Conditional GET (ETag / 304) ──────────────────────
+# In-process data versions restart from zero, so their ETags also carry the process start time.
+ETAG_EPOCH = "" if CACHE_SHARED else f"{int(time.time()):x}."
+
+def conditional(validator=None):
+    """
+    Decorator: tag 200 responses with an ETag and answer a matching If-None-Match
+    with an empty 304. validator(*args, **kwargs) derives the ETag from cheap state
+    (data versions, the fix's updated_at), so a 304 runs no query and serializes
+    nothing; when it is missing or returns None the ETag is a hash of the body.
+    Goes above @versioned_cache so cached bodies are tagged per request rather
+    than a 304 being cached.
+    """
+    from functools import wraps
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            etag = validator(*args, **kwargs) if validator else None
+            if etag is not None and etag in request.if_none_match:
+                resp = app.response_class(status=304)
+                resp.set_etag(etag)
+            else:
+                resp = app.make_response(f(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+                if etag is not None:
+                    resp.set_etag(etag)
+                else:
+                    if resp.get_etag()[0] is None:
+                        resp.add_etag()
+                    resp = resp.make_conditional(request)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+        return decorated
+    return decorator
+
+def versions_etag(name, *entities):
+    """Validator for a view that only reads these entity types."""
+    return lambda *args, **kwargs: \
+        f"{ETAG_EPOCH}{name}:{':'.join(map(str, args + tuple(kwargs.values())))}:{data_versions.key(*entities)}"
+
+
+# ─── Versioned Response Cache ──────────────────────────
+# Cached views are keyed by the versions of the entity types they read; admin writes
+# call data_changed() instead of cache.clear(), which bumps those versions and
+# re-renders the affected views in the background so the next reader hits a warm key.
+# With the shared cache the versions live in a memory-mapped file, so a write in one
+# worker invalidates every worker's entries and in-process indexes.
+DATA_ENTITIES = ("route", "service", "vehicle", "stop", "driver")
+# versions.bin sits next to the cached entries and outlives worker restarts, so booting a worker
+# never invalidates the others; a recreated file starts its counters at the current time, so
+# entries it did not version are never matched again.
+data_versions = DataVersions(DATA_ENTITIES, path=os.path.join(CACHE_DIR, "versions.bin") if CACHE_SHARED else None)
+_versioned_views = {}      # endpoint -> entity types it reads
+_seen_versions = data_versions.snapshot()
+
+# Expired entries are served for up to CACHE_STALE_FACTOR x their TTL while one background
+# task rebuilds them; concurrent misses on one key wait for a single rebuild.
+single_flight = SingleFlight(cache.cache, lambda fn, *a: socketio.start_background_task(fn, *a))
+CACHE_STALE_FACTOR = float(os.getenv("CACHE_STALE_FACTOR", "1"))
+
+def versioned_cache(timeout, *entities):
+    """Cache a view under the entities' data versions, single-flight and stale-while-revalidate."""
+    from functools import wraps
+    def decorator(f):
+        _versioned_views[f.__name__] = entities
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = f"view:{f.__name__}:{data_versions.key(*entities)}"
+            path = request.full_path
+
+            def rebuild():
+                with app.test_request_context(path):
+                    return app.make_response(f(*args, **kwargs))
+
+            return single_flight.get(key, lambda: app.make_response(f(*args, **kwargs)),
+                                     timeout, timeout * CACHE_STALE_FACTOR, rebuild=rebuild)
+        return decorated
+    return decorator
+
+def data_changed(*entities):
+    """
+    Drop this process's indexes that read these entity types, invalidate every
+    cached view reading them and warm their new keys.
+    """
+    invalidate_local_indexes(entities)
+    for name, version in data_versions.bump(*entities).items():
+        if _seen_versions.get(name) == version - 1:
+            _seen_versions[name] = version  # our own write, already applied above
+    stale = [ep for ep, deps in _versioned_views.items() if set(deps) & set(entities)]
+    if stale:
+        socketio.start_background_task(_warm_views, stale)
+
+def _warm_views(endpoints):
+    for endpoint in endpoints:
+        try:
+            with app.test_request_context():
+                path = url_for(endpoint)
+            with app.test_request_context(path):
+                app.view_functions[endpoint]()
+        except Exception as e:
+            print(f"[CACHE] Could not warm {endpoint}: {e}", flush=True)
+
+def invalidate_local_indexes(entities):
+    """Drop this process's derived indexes that read the given entity types."""
+    entities = set(entities)
+    if entities & {"route", "service", "stop"}:
+        route_geometry.clear()
+    if entities & {"route", "stop"}:
+        travel_model.invalidate()
+    if entities & {"route", "service", "stop", "vehicle"}:
+        arrival_index.invalidate()
+    if entities & {"route", "stop"}:
+        stop_grid.clear()
+        stop_name_index.invalidate()
+    if "route" in entities:
+        station_index.invalidate()
+    if entities & {"service", "vehicle"}:
+        _service_ids.clear()
+        bus_grid.clear()
+    if entities & {"driver", "service", "route"}:
+        forget_driver_records()
+
+@app.before_request
+def sync_data_versions():
+    """Pick up admin writes made by other workers (shared cache only)."""
+    if not CACHE_SHARED:
+        return
+    changed = data_versions.changed(_seen_versions)
+    if changed:
+        invalidate_local_indexes(changed)
+        dashboard_counters.invalidate(*(name for entity in changed for name in ENTITY_COUNTERS.get(entity, ())))
+
+
 # ═══════════════════════════════════════════════════════
 # PAGE ROUTES
 # ═══════════════════════════════════════════════════════
@@ -176,10 +710,9 @@ def search_buses():
 
     query = db.session.query(Service, Route, Vehicle).join(Route).join(Vehicle)
     
-    condition = or_(
-        and_(Route.from_station.ilike(f"%{from_station}%"), Route.to_station.ilike(f"%{to_station}%")),
-        and_(Route.from_station.ilike(f"%{to_station}%"), Route.to_station.ilike(f"%{from_station}%"))
-    )
+    condition = station_pair_condition(from_station, to_station)
+    if condition is None:
+        return jsonify([])
     query = query.filter(condition)
 
     if service_type:
@@ -225,12 +758,14 @@ def timetable():
 
     query = db.session.query(Service.service_no, TimetableEntry.arrival_time).join(TimetableEntry).join(Route).join(Stop, TimetableEntry.stop_id == Stop.stop_id)
     
-    condition = or_(
-        and_(Route.from_station.ilike(f"%{from_station}%"), Route.to_station.ilike(f"%{to_station}%")),
-        and_(Route.from_station.ilike(f"%{to_station}%"), Route.to_station.ilike(f"%{from_station}%"))
-    )
+    condition = station_pair_condition(from_station, to_station)
+    ensure_stop_name_index()
+    stop_names = stop_name_index.resolve(from_station)
+    if condition is None or stop_names == []:
+        return jsonify([])
     query = query.filter(condition)
-    query = query.filter(Stop.stop_name.ilike(f"%{from_station}%"))
+    if stop_names is not None:
+        query = query.filter(Stop.stop_name.in_(stop_names))
     query = query.order_by(TimetableEntry.arrival_time.asc())
 
     results = []
@@ -239,20 +774,123 @@ def timetable():
 
     return jsonify(results)
 
+@app.route("/api/arrivals")
+def stop_arrivals():
+    """
+    Next arrivals at a stop, merging live ETAs with the timetable.
+    Query params: ?stop_id=12 or ?stop=StopName (all stops with that name), &limit=10
+    """
+    ensure_arrival_index()
+    ensure_travel_model_job()
+
+    stop_id = request.args.get("stop_id", type=int)
+    stop_name = request.args.get("stop", "").strip()
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 50)
+
+    if stop_id is not None:
+        stop_ids = [stop_id] if arrival_index.stop(stop_id) else []
+    elif stop_name:
+        stop_ids = arrival_index.stop_ids_for(stop_name)
+    else:
+        return jsonify({"error": "Missing stop_id or stop"}), 400
+
+    if not stop_ids:
+        return jsonify({"error": "Stop not found"}), 404
+
+    return jsonify({
+        "stops": [arrival_index.stop(sid) for sid in stop_ids],
+        "services": sorted(set().union(*(arrival_index.services_at(sid) for sid in stop_ids))),
+        "arrivals": arrival_index.arrivals(stop_ids, limit=limit)
+    })
+
+@app.route("/api/stops/nearby")
+def nearby_stops():
+    """
+    Stops closest to a point, nearest first.
+    Query params: lat, lng, radius_km (default 1, max 25), limit (default 10, max 50)
+    """
+    lat = request.args.get("lat", type=float)
+    lng = request.args.get("lng", type=float)
+    if lat is None or lng is None:
+        return jsonify({"error": "Missing lat or lng"}), 400
+    radius_km = min(max(request.args.get("radius_km", 1.0, type=float), 0.0), 25.0)
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 50)
+
+    ensure_stop_grid()
+    results = []
+    for dist, _, data in stop_grid.nearest(lat, lng, k=limit, max_radius_km=radius_km):
+        item = dict(data)
+        item["distance_km"] = round(dist, 3)
+        results.append(item)
+    return jsonify(results)
+
+@app.route("/api/buses/nearby")
+def nearby_buses():
+    """
+    Buses currently broadcasting near a point or inside a map viewport.
+    Query params: lat, lng, radius_km (default 2, max 25) — or bbox=minLat,minLng,maxLat,maxLng
+    Optional: limit (default 50, max 200), max_age_min (default 15; 0 disables the freshness filter)
+    """
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    max_age_min = request.args.get("max_age_min", 15, type=float)
+    bbox = request.args.get("bbox", "").strip()
+
+    ensure_bus_grid()
+    if bbox:
+        try:
+            min_lat, min_lng, max_lat, max_lng = [float(x) for x in bbox.split(",")]
+        except ValueError:
+            return jsonify({"error": "bbox must be minLat,minLng,maxLat,maxLng"}), 400
+        hits = bus_grid.within_box(min_lat, min_lng, max_lat, max_lng)
+    else:
+        lat = request.args.get("lat", type=float)
+        lng = request.args.get("lng", type=float)
+        if lat is None or lng is None:
+            return jsonify({"error": "Missing lat/lng or bbox"}), 400
+        radius_km = min(max(request.args.get("radius_km", 2.0, type=float), 0.0), 25.0)
+        hits = bus_grid.within(lat, lng, radius_km)
+
+    now = time.time()
+    results = []
+    for dist, _, pos in hits:
+        if max_age_min and fix_age_seconds(pos["updated_at"], now) > max_age_min * 60:
+            continue
+        item = dict(pos)
+        item["distance_km"] = round(dist, 3)
+        results.append(item)
+        if len(results) >= limit:
+            break
+    return jsonify(results)
+
+def live_etag(service_no):
+    pos = get_live_position(service_no)
+    if not pos or request.args.get("predict") == "1":
+        return None
+    return f"live:{pos['vehicle_id']}:{pos['updated_at']}:{pos['lat']}:{pos['lng']}:{pos['speed']}"
+
 @app.route("/api/live/<service_no>")
+@conditional(live_etag)
 def live_tracking(service_no):
-    res = db.session.query(LiveLocation).join(Vehicle).join(Service).filter(Service.service_no == service_no).first()
+    res = get_live_position(service_no)
     if not res:
         return jsonify({"error": "Live data not found"}), 404
     
-    return jsonify({
-        "lat": res.lat,
-        "lng": res.lng,
-        "speed": res.speed,
-        "updated_at": res.updated_at
-    })
+    payload = {
+        "lat": res["lat"],
+        "lng": res["lng"],
+        "speed": res["speed"],
+        "updated_at": res["updated_at"],
+        "route_offset_km": res.get("route_offset_km")
+    }
+    if request.args.get("predict") == "1":
+        # Dead-reckoned position from the filter's velocity estimate (at most 30 s ahead)
+        predicted = fix_filter.predict(res["vehicle_id"], time.time())
+        if predicted:
+            payload["predicted"] = {"lat": predicted[0], "lng": predicted[1]}
+    return jsonify(payload)
 
 @app.route("/api/route_details/<service_no>")
+@conditional(versions_etag("route_details", "route", "service", "stop"))
 def route_details(service_no):
     stops = db.session.query(Stop).join(Route).join(Service, Service.route_id == Route.route_id).filter(Service.service_no == service_no).order_by(Stop.stop_order.asc()).all()
     if not stops:
@@ -268,83 +906,290 @@ def calculate_eta(service_no):
     Optional query param: ?destination=StopName to get ETA to a specific stop.
     """
     # Get live location
-    live = db.session.query(LiveLocation).join(Vehicle).join(Service).filter(Service.service_no == service_no).first()
+    live = get_live_position(service_no)
     if not live:
         return jsonify({"error": "ETA data not found — bus not broadcasting"}), 404
 
-    bus_lat, bus_lng = live.lat, live.lng
-    speed = live.speed or 1  # Avoid division by zero
-
-    # Get route stops in order
-    stops = db.session.query(Stop).join(Route).join(Service, Service.route_id == Route.route_id)\
-        .filter(Service.service_no == service_no).order_by(Stop.stop_order.asc()).all()
-
-    if not stops:
+    # Precomputed stop arrays + cumulative distances for the service's route
+    geom = get_service_geometry(service_no)
+    if not geom:
         return jsonify({"error": "Route stops not found"}), 404
 
+    ensure_travel_model_job()
     destination_name = request.args.get("destination", "").strip()
 
-    # Find the closest stop to the bus (current position on route)
-    min_dist = float('inf')
-    closest_idx = 0
-    for i, st in enumerate(stops):
-        d = haversine(bus_lat, bus_lng, st.lat, st.lng)
-        if d < min_dist:
-            min_dist = d
-            closest_idx = i
-
     # Determine destination stop index
-    dest_idx = len(stops) - 1  # Default: last stop (terminal)
+    dest_idx = len(geom) - 1  # Default: last stop (terminal)
     if destination_name:
-        for i, st in enumerate(stops):
-            if st.stop_name.lower() == destination_name.lower():
-                dest_idx = i
-                break
+        named_idx = geom.index_of(destination_name)
+        if named_idx is not None:
+            dest_idx = named_idx
+
+    return jsonify(eta_from_position(service_no, live, geom, dest_idx))
+
+
+def blend_eta(speed, geom, from_idx, lead_km, dest_idx, remaining_km):
+    """
+    (eta_minutes, source) for a bus lead_km before stop from_idx with remaining_km
+    to go to dest_idx — live speed blended with historical segment times.
+    """
+    live_minutes = (remaining_km / max(speed or 1, 1)) * 60
+    hist_seconds = None
+    if from_idx <= dest_idx:
+        hist_seconds = travel_model.remaining_seconds(geom, from_idx, dest_idx, lead_km)
+    if hist_seconds is None:
+        return int(live_minutes), "live"
+    w = ETA_LIVE_WEIGHT * min(float(speed or 0) / ETA_LIVE_FULL_SPEED, 1.0)
+    return int(w * live_minutes + (1 - w) * hist_seconds / 60), "blended" if w > 0 else "historical"
+
+def eta_from_position(service_no, live, geom, dest_idx, closest=None):
+    """
+    ETA payload for one bus position against a route geometry.
+    closest is an optional precomputed (closest_idx, dist_km) from a batch pass.
+    """
+    bus_lat, bus_lng = live["lat"], live["lng"]
+    speed = live["speed"] or 1  # Avoid division by zero
+    offset = live.get("route_offset_km") if live.get("route_id") == geom.route_id else None
+
+    if offset is not None:
+        # Map-matched progress: measure from the next stop ahead, never one behind the bus
+        from_idx = geom.next_stop_index(offset)
+        lead_km = geom.cum_km[from_idx] - offset if from_idx < len(geom) else 0.0
+        ahead = from_idx <= dest_idx
+        stops_remaining = dest_idx - from_idx + 1 if ahead else 0
+        if closest is None:
+            closest = geom.nearest_of(bus_lat, bus_lng, (from_idx - 1, from_idx))
+        closest_idx, dist_to_closest = closest
+    else:
+        # Find the closest stop to the bus (current position on route)
+        if closest is None:
+            closest = geom.nearest_stop(bus_lat, bus_lng)
+        closest_idx, dist_to_closest = closest
+        from_idx, lead_km = closest_idx, dist_to_closest
+        ahead = closest_idx < dest_idx
+        stops_remaining = dest_idx - closest_idx if ahead else 0
 
     # Calculate remaining distance along route from bus to destination
-    remaining_distance = 0.0
-    stops_remaining = 0
-
-    if closest_idx < dest_idx:
-        # Bus is before destination — normal forward travel
-        # Distance from bus to the nearest stop ahead
-        remaining_distance += haversine(bus_lat, bus_lng, stops[closest_idx].lat, stops[closest_idx].lng)
-        # Then sum stop-to-stop distances
-        for i in range(closest_idx, dest_idx):
-            remaining_distance += haversine(stops[i].lat, stops[i].lng, stops[i+1].lat, stops[i+1].lng)
-        stops_remaining = dest_idx - closest_idx
-    elif closest_idx == dest_idx:
-        # Bus is at/near the destination stop
-        remaining_distance = haversine(bus_lat, bus_lng, stops[dest_idx].lat, stops[dest_idx].lng)
-        stops_remaining = 0
+    if ahead:
+        remaining_distance = lead_km + geom.distance_between(from_idx, dest_idx)
     else:
-        # Bus has passed the destination (reverse direction route?)
-        remaining_distance = haversine(bus_lat, bus_lng, stops[dest_idx].lat, stops[dest_idx].lng)
-        stops_remaining = 0
+        # Bus is at/near or past the destination stop
+        remaining_distance = haversine(bus_lat, bus_lng, geom.lats[dest_idx], geom.lngs[dest_idx])
 
-    # Calculate ETA in minutes
-    eta_minutes = int((remaining_distance / max(speed, 1)) * 60)
+    eta_minutes, eta_source = blend_eta(live["speed"], geom, from_idx, lead_km, dest_idx, remaining_distance)
 
     # Calculate stop status
-    dist_to_closest = haversine(bus_lat, bus_lng, stops[closest_idx].lat, stops[closest_idx].lng)
     bus_status = "En Route"
     if dist_to_closest < 0.3:
         bus_status = "At Station"
     elif dist_to_closest < 1.0:
         bus_status = "Approaching"
 
-    return jsonify({
+    return {
         "service_no": service_no,
         "remaining_distance_km": round(remaining_distance, 2),
         "speed_kmph": speed,
         "eta_minutes": eta_minutes,
+        "eta_source": eta_source,
         "stops_remaining": stops_remaining,
-        "destination": stops[dest_idx].stop_name,
-        "closest_stop": stops[closest_idx].stop_name,
+        "destination": geom.names[dest_idx],
+        "closest_stop": geom.names[closest_idx],
         "bus_status": bus_status,
         "bus_lat": bus_lat,
-        "bus_lng": bus_lng
-    })
+        "bus_lng": bus_lng,
+        "route_offset_km": offset
+    }
+
+
+# ─── Fleet-wide ETA Snapshot ───────────────────────────
+FLEET_ETA_TTL = int(os.getenv("FLEET_ETA_TTL", "5"))
+
+def build_fleet_eta(stop_name=""):
+    """
+    ETAs for every broadcasting bus in one pass: buses are grouped by route and
+    each group's nearest stops are found with a single batch distance kernel.
+    With stop_name, only buses on routes serving that stop and not yet past it.
+    """
+    ensure_live_store_warm()
+    ensure_travel_model_job()
+
+    by_route = {}
+    for pos in live_store.all():
+        geom = get_service_geometry(pos["service_no"])
+        if geom:
+            by_route.setdefault(geom.route_id, (geom, []))[1].append(pos)
+
+    etas = []
+    for geom, positions in by_route.values():
+        dest_idx = len(geom) - 1
+        if stop_name:
+            dest_idx = geom.index_of(stop_name)
+            if dest_idx is None:
+                continue
+        # Map-matched buses already carry their progress; the rest get one batch nearest-stop pass
+        unmatched = [p for p in positions if p.get("route_offset_km") is None or p.get("route_id") != geom.route_id]
+        closest = {}
+        if unmatched:
+            indices, dists = nearest_points([p["lat"] for p in unmatched], [p["lng"] for p in unmatched],
+                                            geom.lats, geom.lngs)
+            closest = {p["vehicle_id"]: (int(i), float(d)) for p, i, d in zip(unmatched, indices, dists)}
+        for pos in positions:
+            bus_closest = closest.get(pos["vehicle_id"])
+            if stop_name:
+                first_ahead = bus_closest[0] if bus_closest else geom.next_stop_index(pos["route_offset_km"])
+                if first_ahead > dest_idx:
+                    continue  # already passed this stop
+            eta = eta_from_position(pos["service_no"], pos, geom, dest_idx, bus_closest)
+            eta["vehicle_id"] = pos["vehicle_id"]
+            eta["updated_at"] = pos["updated_at"]
+            etas.append(eta)
+
+    etas.sort(key=lambda e: e["eta_minutes"])
+    return {
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "stop": stop_name or None,
+        "count": len(etas),
+        "etas": etas
+    }
+
+@app.route("/api/fleet/eta")
+def fleet_eta():
+    """
+    ETAs for every running bus, or with ?stop=StopName for every bus due at that stop.
+    Cached per FLEET_ETA_TTL-second window, so new fixes show up within one window;
+    the key includes the route/service/stop versions so admin edits apply at once.
+    """
+    stop_name = request.args.get("stop", "").strip()
+    window = int(time.time() // max(FLEET_ETA_TTL, 1))
+    key = f"local:fleet_eta:{stop_name.lower()}:{window}:{data_versions.key('route', 'service', 'stop')}"
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_fleet_eta(stop_name)
+        cache.set(key, snapshot, timeout=FLEET_ETA_TTL)
+    return jsonify(snapshot)
+
+
+# ═══════════════════════════════════════════════════════
+# WEBSOCKET — live tracking rooms (one room per service_no)
+# ═══════════════════════════════════════════════════════
+
+def tracking_room(service_no, binary=False):
+    return f"track_bin_{service_no}" if binary else f"track_{service_no}"
+
+# Delta subscribers ("format": "delta") get coalesced frames from one background loop
+# every DELTA_TICK_S, at most DELTA_MAX_FPS per service, with a keyframe every DELTA_KEYFRAME_EVERY.
+delta_stream = DeltaStream(
+    max_fps=float(os.getenv("DELTA_MAX_FPS", "1")),
+    keyframe_every=int(os.getenv("DELTA_KEYFRAME_EVERY", "20"))
+)
+DELTA_TICK_S = float(os.getenv("DELTA_TICK_S", "0.2"))
+_delta_loop_lock = threading.Lock()
+_delta_loop_started = False
+
+def _delta_loop():
+    while True:
+        socketio.sleep(DELTA_TICK_S)
+        for sid, frame in delta_stream.due_frames():
+            socketio.emit("location_delta", frame, to=sid,
+                          callback=lambda *_, sid=sid, s=frame["s"], q=frame["q"]: delta_stream.ack(sid, s, q))
+
+def ensure_delta_loop():
+    global _delta_loop_started
+    with _delta_loop_lock:
+        if _delta_loop_started:
+            return
+        _delta_loop_started = True
+    socketio.start_background_task(_delta_loop)
+
+def fix_epoch_ms(pos):
+    """Epoch milliseconds of a stored position's updated_at (second precision)."""
+    if not pos.get("updated_at"):
+        return int(time.time() * 1000)
+    return int(round(time.time() - fix_age_seconds(pos["updated_at"]))) * 1000
+
+def publish_location(payload):
+    """Fan out an accepted fix to every socket tracking its service (JSON, binary and delta)."""
+    service_no = payload["service_no"]
+    socketio.emit("location_update", payload, to=tracking_room(service_no))
+    updated_ms = fix_epoch_ms(payload)
+    service_id = resolve_service_id(service_no)
+    if service_id is not None:
+        frame = fix_codec.encode_fix(service_id, payload["lat"], payload["lng"], payload["speed"], updated_ms)
+        socketio.emit("location_update", frame, to=tracking_room(service_no, binary=True))
+    delta_stream.publish(payload, updated_ms // 1000)
+    sse_broker.publish(service_no, payload)
+
+@socketio.on("join_tracking")
+def on_join_tracking(data):
+    """
+    {"service_no", "format": "json" | "binary" | "delta", "max_fps"}
+    binary frames use fix_codec.FIX; delta frames (see DeltaStream) arrive as
+    location_delta and must be acknowledged through the Socket.IO ack callback.
+    """
+    service_no = (data or {}).get("service_no")
+    if not service_no:
+        return {"error": "Missing service_no"}
+    if data.get("format") == "delta":
+        pos = get_live_position(service_no)
+        if pos:
+            delta_stream.publish(pos, fix_epoch_ms(pos) // 1000)
+        delta_stream.subscribe(request.sid, service_no, data.get("max_fps"))
+        ensure_delta_loop()
+        return {"message": "Joined", "format": "delta", "scale": DELTA_SCALE}
+    room = tracking_room(service_no, binary=data.get("format") == "binary")
+    join_room(room)
+    return {"message": "Joined", "room": room}
+
+@socketio.on("leave_tracking")
+def on_leave_tracking(data):
+    service_no = (data or {}).get("service_no")
+    if not service_no:
+        return {"error": "Missing service_no"}
+    if data.get("format") == "delta":
+        delta_stream.unsubscribe(request.sid, service_no)
+        return {"message": "Left", "format": "delta"}
+    room = tracking_room(service_no, binary=data.get("format") == "binary")
+    leave_room(room)
+    return {"message": "Left", "room": room}
+
+@socketio.on("disconnect")
+def on_disconnect():
+    delta_stream.unsubscribe(request.sid)
+
+
+# ─── Server-Sent Events fallback ───────────────────────
+# For clients behind proxies that strip WebSocket upgrades. Fed by publish_location,
+# like the socket rooms; a comment line every SSE_KEEPALIVE_S keeps idle proxies open.
+sse_broker = SSEBroker(max_clients=int(os.getenv("SSE_MAX_CLIENTS", "500")))
+SSE_KEEPALIVE_S = float(os.getenv("SSE_KEEPALIVE_S", "15"))
+
+@app.route("/api/live/<service_no>/stream")
+def live_stream(service_no):
+    """text/event-stream of location_update events for one service, starting with its last fix."""
+    q = sse_broker.subscribe(service_no)
+    if q is None:
+        return jsonify({"error": "Too many live streams, poll /api/live instead"}), 503
+    first = get_live_position(service_no)
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            if first:
+                yield SSEBroker.format_event(first, event_id=fix_epoch_ms(first))
+            while True:
+                try:
+                    pos = q.get(timeout=SSE_KEEPALIVE_S)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield SSEBroker.format_event(pos, event_id=fix_epoch_ms(pos))
+        finally:
+            sse_broker.unsubscribe(service_no, q)
+
+    resp = Response(generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 
 # ═══════════════════════════════════════════════════════
@@ -407,6 +1252,78 @@ def user_logout():
 # DRIVER AUTH (with service linking)
 # ═══════════════════════════════════════════════════════
 
+# ─── Driver Assignment Cache ───────────────────────────
+# driver_id -> {"driver_id", "username", "assigned_service"}, loaded with one joined query
+# and dropped whenever driver, service or route data changes (invalidate_local_indexes).
+_driver_records = {}
+
+def _driver_record_query():
+    return db.session.query(Driver.id, Driver.username, Service.service_id, Service.service_no, Route.route_name)\
+        .outerjoin(Service, Service.service_id == Driver.assigned_service_id)\
+        .outerjoin(Route, Route.route_id == Service.route_id)
+
+def _driver_record(row):
+    driver_id, username, service_id, service_no, route_name = row
+    assigned = None
+    if service_id is not None:
+        assigned = {"service_id": service_id, "service_no": service_no, "route": route_name or ""}
+    record = {"driver_id": driver_id, "username": username, "assigned_service": assigned}
+    _driver_records[driver_id] = record
+    return record
+
+def get_driver_record(driver_id):
+    """Cached driver + assigned service, or None if the driver does not exist."""
+    record = _driver_records.get(driver_id)
+    if record is not None:
+        return record
+    row = _driver_record_query().filter(Driver.id == driver_id).first()
+    return _driver_record(row) if row else None
+
+def forget_driver_records(driver_id=None):
+    if driver_id is None:
+        _driver_records.clear()
+    else:
+        _driver_records.pop(driver_id, None)
+
+# ─── Driver Tokens ─────────────────────────────────────
+# Signed {"d": driver_id, "s": assigned service_no, "g": assignment generation}, sent by the
+# driver page as X-Driver-Token. The generation is the "driver" data version, which
+# assign_driver (and driver/service deletes) bump, so ingest can trust the assignment in a
+# token while the generation is current without reading the DB. An outdated token is
+# re-checked against the assignment cache and replaced through the X-Driver-Token response header.
+# Versions never repeat (see DataVersions): a restart outdates every token in local mode, while
+# with CACHE_BACKEND=shared tokens stay current across workers and restarts.
+DRIVER_TOKEN_HEADER = "X-Driver-Token"
+DRIVER_TOKEN_MAX_AGE = int(os.getenv("DRIVER_TOKEN_MAX_AGE", str(12 * 3600)))
+driver_tokens = URLSafeTimedSerializer(app.secret_key, salt="driver-token")
+
+def issue_driver_token(record, generation):
+    """Token for record; generation must be read before the record was loaded."""
+    assigned = record["assigned_service"]
+    return driver_tokens.dumps({"d": record["driver_id"], "s": assigned["service_no"] if assigned else None,
+                                "g": generation})
+
+def driver_token_claims():
+    """Verified claims of this request's driver token (plus "current"), or None. Parsed once per request."""
+    if "driver_claims" not in g:
+        claims = None
+        token = request.headers.get(DRIVER_TOKEN_HEADER)
+        if token:
+            try:
+                claims = driver_tokens.loads(token, max_age=DRIVER_TOKEN_MAX_AGE)
+                claims["current"] = claims.get("g") == data_versions.get("driver")
+            except (BadSignature, TypeError, AttributeError):
+                claims = None
+        g.driver_claims = claims
+    return g.driver_claims
+
+@app.after_request
+def send_driver_token(response):
+    token = g.pop("driver_token", None)
+    if token:
+        response.headers[DRIVER_TOKEN_HEADER] = token
+    return response
+
 @app.route("/api/driver/login", methods=["POST"])
 @limiter.limit("5 per minute")
 def driver_login():
@@ -414,7 +1331,9 @@ def driver_login():
     username = data.get("username")
     password = data.get("password")
 
-    driver = Driver.query.filter_by(username=username).first()
+    generation = data_versions.get("driver")
+    driver = Driver.query.options(joinedload(Driver.assigned_service).joinedload(Service.route))\
+        .filter_by(username=username).first()
 
     if driver and check_password_hash(driver.password, password):
         session.clear()
@@ -422,23 +1341,20 @@ def driver_login():
         session["username"] = driver.username
         session.permanent = True
 
-        # Include assigned service info
-        assigned_service = None
-        if driver.assigned_service_id:
-            svc = Service.query.get(driver.assigned_service_id)
-            if svc:
-                assigned_service = {
-                    "service_id": svc.service_id,
-                    "service_no": svc.service_no,
-                    "route": svc.route.route_name if svc.route else ""
-                }
+        # Include assigned service info (loaded with the driver above)
+        svc = driver.assigned_service
+        record = _driver_record((driver.id, driver.username, svc.service_id if svc else None,
+                                 svc.service_no if svc else None,
+                                 svc.route.route_name if svc and svc.route else None))
+        assigned_service = record["assigned_service"]
         
         session["assigned_service_no"] = assigned_service["service_no"] if assigned_service else None
 
         return jsonify({
             "message": "Login successful",
             "redirect": "/driver",
-            "assigned_service": assigned_service
+            "assigned_service": assigned_service,
+            "driver_token": issue_driver_token(record, generation)
         })
     
     return jsonify({"error": "Invalid credentials"}), 401
@@ -454,25 +1370,12 @@ def driver_info():
     if "driver_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
-    driver = Driver.query.get(session["driver_id"])
-    if not driver:
+    generation = data_versions.get("driver")
+    record = get_driver_record(session["driver_id"])
+    if not record:
         return jsonify({"error": "Driver not found"}), 404
 
-    assigned_service = None
-    if driver.assigned_service_id:
-        svc = Service.query.get(driver.assigned_service_id)
-        if svc:
-            assigned_service = {
-                "service_id": svc.service_id,
-                "service_no": svc.service_no,
-                "route": svc.route.route_name if svc.route else ""
-            }
-
-    return jsonify({
-        "driver_id": driver.id,
-        "username": driver.username,
-        "assigned_service": assigned_service
-    })
+    return jsonify(dict(record, driver_token=issue_driver_token(record, generation)))
 
 
 # ═══════════════════════════════════════════════════════
@@ -485,10 +1388,70 @@ DEBUG_LOGS = []
 def get_debug_logs():
     return jsonify(DEBUG_LOGS[-20:])
 
+def check_driver_assignment(service_no):
+    """Return an error message if the driver (token or session) is assigned to a different service."""
+    claims = driver_token_claims()
+    if claims and claims["current"]:
+        assigned_no = claims["s"]
+    else:
+        driver_id = claims["d"] if claims else session.get("driver_id")
+        if driver_id is None:
+            return None
+        generation = data_versions.get("driver")
+        record = get_driver_record(driver_id)
+        if record is None:
+            return None
+        if request.headers.get(DRIVER_TOKEN_HEADER):
+            # Outdated, expired or foreign token: replace it with one for the current assignment
+            g.driver_token = issue_driver_token(record, generation)
+        assigned = record["assigned_service"]
+        assigned_no = assigned["service_no"] if assigned else None
+    if assigned_no and assigned_no != service_no:
+        return f"You are assigned to service {assigned_no}, not {service_no}"
+    return None
+
+# Device timestamps (epoch ms) order fixes and drive the GPS filter, but one more than
+# FIX_CLOCK_SKEW_S ahead of the server clock is replaced by the receive time.
+FIX_CLOCK_SKEW_S = float(os.getenv("FIX_CLOCK_SKEW_S", "10"))
+
+def fix_time_ms(ts, now_ms, clamp=True):
+    """Validated device timestamp in epoch ms; now_ms when missing or (clamp) too far ahead. Raises ValueError if not a time."""
+    if not ts:
+        return now_ms
+    if isinstance(ts, bool) or not isinstance(ts, (int, float)) or not math.isfinite(ts) or ts < 0:
+        raise ValueError("Invalid ts")
+    ts = int(ts)
+    return now_ms if clamp and ts > now_ms + FIX_CLOCK_SKEW_S * 1000 else ts
+
+def ingest_fix(service_no, vehicle_id, lat, lng, speed, timestamp, ts_ms=None):
+    """Accept one validated fix into the history log, live store and derived indexes. Returns the stored position."""
+    fix_log.append(vehicle_id, ts_ms or int(time.time() * 1000), lat, lng, speed)
+    return store_position(service_no, vehicle_id, lat, lng, speed, timestamp)
+
+def store_position(service_no, vehicle_id, lat, lng, speed, timestamp, dirty=True):
+    """Put a position into the live store and the derived indexes (route progress, bus grid, arrivals)."""
+    geom = get_service_geometry(service_no)
+    progress = match_to_route(geom, lat, lng, live_store.get_vehicle(vehicle_id)) if geom else {}
+    pos = live_store.put(service_no, vehicle_id, lat, lng, speed, timestamp, dirty=dirty, **progress)
+    if bus_grid.ready:
+        bus_grid.move(vehicle_id, lat, lng, pos)
+    if arrival_index.ready and geom:
+        arrival_index.on_fix(pos, geom, *route_progress(pos, geom), eta=arrival_eta(pos, geom))
+    return pos
+
 @app.route("/api/update_location", methods=["POST"])
 def update_location():
     try:
-        data = request.json
+        # Compact binary fix (fix_codec.FIX) or the JSON body
+        binary = request.mimetype == fix_codec.MIMETYPE
+        if binary:
+            try:
+                (service_id, lat, lng, speed, ts), = fix_codec.decode_fixes(request.get_data())
+            except ValueError:
+                return jsonify({"error": f"Expected one {fix_codec.FIX.size}-byte fix"}), 400
+            data = {"service_no": resolve_service_no(service_id), "lat": lat, "lng": lng, "speed": speed, "ts": ts}
+        else:
+            data = request.json
         if not data:
             return jsonify({"error": "No JSON data received"}), 400
             
@@ -505,36 +1468,166 @@ def update_location():
             return jsonify({"error": "Missing data"}), 400
 
         # ── Driver-Service Linking Enforcement ──
-        if "driver_id" in session:
-            driver = Driver.query.get(session["driver_id"])
-            if driver and driver.assigned_service_id:
-                assigned_svc = Service.query.get(driver.assigned_service_id)
-                if assigned_svc and assigned_svc.service_no != service_no:
-                    return jsonify({"error": f"You are assigned to service {assigned_svc.service_no}, not {service_no}"}), 403
-
-        v = db.session.query(Vehicle).join(Service).filter(Service.service_no == service_no).first()
-        if not v:
+        assignment_error = check_driver_assignment(service_no)
+        if assignment_error:
+            return jsonify({"error": assignment_error}), 403
+
+        vehicle_id = resolve_vehicle_id(service_no)
+        if vehicle_id is None:
             return jsonify({"error": "Service/Vehicle not found"}), 404
 
+        try:
+            ts = fix_time_ms(data.get("ts"), int(time.time() * 1000))
+        except ValueError:
+            return jsonify({"error": "Invalid ts"}), 400
+        try:
+            verdict, lat, lng, speed = fix_filter.process(vehicle_id, ts / 1000.0, lat, lng, speed)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid coordinates"}), 400
+        report_policy.record()
+        if verdict != ACCEPT:
+            # Redundant or impossible fix: no store write, no DB flush, no broadcast
+            if binary:
+                return app.response_class(fix_codec.encode_ack(verdict, report_advice(live_store.get_vehicle(vehicle_id))),
+                                          mimetype=fix_codec.MIMETYPE)
+            return jsonify({"message": f"Fix dropped ({verdict})", "dropped": verdict, "vehicle_id": vehicle_id,
+                            "report": report_advice(live_store.get_vehicle(vehicle_id))})
+
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
 
-        loc = LiveLocation.query.filter_by(bus_id=v.vehicle_id).first()
-        if loc:
-            loc.lat = lat
-            loc.lng = lng
-            loc.speed = speed
-            loc.updated_at = timestamp
-        else:
-            loc = LiveLocation(bus_id=v.vehicle_id, lat=lat, lng=lng, speed=speed, updated_at=timestamp)
-            db.session.add(loc)
+        pos = ingest_fix(service_no, vehicle_id, lat, lng, speed, timestamp, ts_ms=ts)
+        schedule_flush()
 
-        db.session.commit()
+        log_entry = f"{time.strftime('%H:%M:%S')}: [OK] Stored fix for vehicle {vehicle_id} ({live_store.pending()} pending flush)"
+        print(log_entry, flush=True)
+        DEBUG_LOGS.append(log_entry)
+
+        publish_location(pos)
+
+        if binary:
+            return app.response_class(fix_codec.encode_ack(verdict, report_advice(pos)), mimetype=fix_codec.MIMETYPE)
+        return jsonify({"message": "Location updated", "time": timestamp, "vehicle_id": vehicle_id,
+                        "report": report_advice(pos)})
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
 
-        log_entry = f"{time.strftime('%H:%M:%S')}: [OK] Updated DB for vehicle {v.vehicle_id}"
+
+MAX_BATCH_FIXES = 200
+
+@app.route("/api/update_location/batch", methods=["POST"])
+def update_location_batch():
+    """
+    Bulk ingestion for replaying a driver's offline queue.
+    Body: {"fixes": [{"service_no", "lat", "lng", "speed", "ts"}, ...]} where ts is
+    epoch milliseconds (see fix_time_ms; a fix with an invalid ts or service_no is rejected by index).
+    Fixes are applied oldest-first and committed in one transaction;
+    only the newest fix per service is broadcast. A body of concatenated fix_codec.FIX
+    records is accepted as well.
+    """
+    try:
+        if request.mimetype == fix_codec.MIMETYPE:
+            try:
+                records = fix_codec.decode_fixes(request.get_data())
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            if len(records) > MAX_BATCH_FIXES:
+                return jsonify({"error": f"Too many fixes (max {MAX_BATCH_FIXES})"}), 413
+            names = {sid: resolve_service_no(sid) for sid in {rec[0] for rec in records}}
+            fixes = [{"service_no": names[sid], "lat": lat, "lng": lng, "speed": speed, "ts": ts}
+                     for sid, lat, lng, speed, ts in records]
+        else:
+            data = request.json
+            fixes = data.get("fixes") if isinstance(data, dict) else data
+        if not isinstance(fixes, list) or not fixes:
+            return jsonify({"error": "No fixes received"}), 400
+        if len(fixes) > MAX_BATCH_FIXES:
+            return jsonify({"error": f"Too many fixes (max {MAX_BATCH_FIXES})"}), 413
+
+        now_ms = int(time.time() * 1000)
+        rejected = []
+        valid = []
+        for i, fix in enumerate(fixes):
+            if not isinstance(fix, dict):
+                rejected.append({"index": i, "error": "Invalid fix"})
+                continue
+            service_no = fix.get("service_no")
+            if service_no is not None and (isinstance(service_no, bool) or not isinstance(service_no, (str, int))):
+                rejected.append({"index": i, "error": "Invalid service_no"})
+                continue
+            if isinstance(service_no, int):
+                fix["service_no"] = str(service_no)
+            try:
+                valid.append((fix_time_ms(fix.get("ts"), now_ms, clamp=False), i, fix))
+            except ValueError:
+                rejected.append({"index": i, "error": "Invalid ts"})
+
+        # ── Driver-Service Linking Enforcement (all-or-nothing) ──
+        for service_no in {fix["service_no"] for _, _, fix in valid if fix.get("service_no")}:
+            assignment_error = check_driver_assignment(service_no)
+            if assignment_error:
+                return jsonify({"error": assignment_error}), 403
+        # A phone clock running ahead shifts that service's queue back to server time, keeping the spacing
+        newest = {}
+        for ts, _, fix in valid:
+            newest[fix.get("service_no")] = max(ts, newest.get(fix.get("service_no"), ts))
+        ahead = {sno: ts - now_ms for sno, ts in newest.items() if ts - now_ms > FIX_CLOCK_SKEW_S * 1000}
+        if ahead:
+            valid = [(ts - ahead.get(fix.get("service_no"), 0), i, fix) for ts, i, fix in valid]
+        ordered = sorted(valid, key=lambda item: item[:2])
+
+        latest = {}
+        stale = 0
+        dropped = 0
+        for ts, i, fix in ordered:
+            service_no = fix.get("service_no")
+            lat = fix.get("lat")
+            lng = fix.get("lng")
+            if not service_no or not lat or not lng:
+                rejected.append({"index": i, "error": "Missing data"})
+                continue
+            vehicle_id = resolve_vehicle_id(service_no)
+            if vehicle_id is None:
+                rejected.append({"index": i, "error": "Service/Vehicle not found"})
+                continue
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts / 1000.0))
+            current = live_store.get_vehicle(vehicle_id)
+            if current and current["updated_at"] and current["updated_at"] > timestamp:
+                # A fresher fix is already live; keep it for history but don't move the bus backwards
+                fix_log.append(vehicle_id, ts, lat, lng, fix.get("speed", 0))
+                stale += 1
+                continue
+            try:
+                verdict, lat, lng, speed = fix_filter.process(vehicle_id, ts / 1000.0, lat, lng, fix.get("speed", 0))
+            except (TypeError, ValueError):
+                rejected.append({"index": i, "error": "Invalid coordinates"})
+                continue
+            if verdict != ACCEPT:
+                dropped += 1
+                continue
+            latest[service_no] = ingest_fix(service_no, vehicle_id, lat, lng, speed, timestamp, ts_ms=ts)
+
+        report_policy.record(len(fixes))
+        flush_live_store()
+        schedule_flush()
+        for pos in latest.values():
+            publish_location(pos)
+
+        log_entry = f"{time.strftime('%H:%M:%S')}: [OK] Batch of {len(fixes)} fix(es), {len(rejected)} rejected"
         print(log_entry, flush=True)
         DEBUG_LOGS.append(log_entry)
 
-        return jsonify({"message": "Location updated", "time": timestamp, "vehicle_id": v.vehicle_id})
+        return jsonify({
+            "message": "Batch processed",
+            "accepted": len(fixes) - len(rejected) - stale - dropped,
+            "stale": stale,
+            "dropped": dropped,
+            "rejected": rejected,
+            "latest": {sno: pos["updated_at"] for sno, pos in latest.items()},
+            "report": report_advice(next(reversed(latest.values()), None))
+        })
 
     except Exception as e:
         import traceback
@@ -547,34 +1640,69 @@ def update_location():
 # ═══════════════════════════════════════════════════════
 
 @app.route("/api/routes")
-@cache.cached(timeout=600)
+@conditional(versions_etag("routes", "route"))
+@versioned_cache(600, "route")
 def get_all_routes():
     routes = Route.query.all()
     return jsonify([{"route_id": r.route_id, "route_name": r.route_name, "from": r.from_station, "to": r.to_station} for r in routes])
 
 @app.route("/api/stations")
-@cache.cached(timeout=600)
+@conditional(versions_etag("stations", "route"))
+@versioned_cache(600, "route")
 def get_all_stations():
-    from_stations = db.session.query(Route.from_station).distinct()
-    to_stations = db.session.query(Route.to_station).distinct()
-    all_stations = set([r[0] for r in from_stations.all()] + [r[0] for r in to_stations.all()])
-    return jsonify(list(all_stations))
+    ensure_station_index()
+    return jsonify(station_index.names())
+
+@app.route("/api/stations/suggest")
+def suggest_stations():
+    """Ranked station typeahead: ?q=text&limit=10"""
+    q = request.args.get("q", "")
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 50)
+    ensure_station_index()
+    return jsonify(station_index.suggest(q, limit=limit))
+
+# ─── Dashboard Counters ────────────────────────────────
+# Row counts are loaded once and then adjusted by the admin create/delete endpoints;
+# live metrics come from the in-memory live store (fixes within DASHBOARD_LIVE_WINDOW_MIN).
+dashboard_counters = DashboardCounters({
+    "routes": lambda: Route.query.count(),
+    "services": lambda: Service.query.count(),
+    "vehicles": lambda: Vehicle.query.count(),
+    "running": lambda: Vehicle.query.filter_by(status='Running').count(),
+    "drivers": lambda: Driver.query.count()
+})
+ENTITY_COUNTERS = {"route": ("routes",), "service": ("services",), "vehicle": ("vehicles", "running"), "driver": ("drivers",)}
+DASHBOARD_LIVE_WINDOW_MIN = float(os.getenv("DASHBOARD_LIVE_WINDOW_MIN", "5"))
+DASHBOARD_TTL = int(os.getenv("DASHBOARD_TTL", "15"))
+
+def _speed_kmph(pos):
+    try:
+        return float(pos.get("speed") or 0)
+    except (TypeError, ValueError):
+        return 0.0
 
 @app.route("/api/dashboard")
-@cache.cached(timeout=60)
+@versioned_cache(DASHBOARD_TTL, "route", "service", "vehicle", "driver")
 def dashboard():
-    routes = Route.query.count()
-    services = Service.query.count()
-    vehicles = Vehicle.query.count()
-    running = Vehicle.query.filter_by(status='Running').count()
-    drivers = Driver.query.count()
+    counts = dashboard_counters.get()
+
+    ensure_live_store_warm()
+    now = time.time()
+    live = [p for p in live_store.all() if fix_age_seconds(p["updated_at"], now) <= DASHBOARD_LIVE_WINDOW_MIN * 60]
+    speeds = [_speed_kmph(p) for p in live]
 
     return jsonify({
-        "total_routes": routes,
-        "total_services": services,
-        "total_vehicles": vehicles,
-        "running_buses": running,
-        "total_drivers": drivers
+        "total_routes": counts["routes"],
+        "total_services": counts["services"],
+        "total_vehicles": counts["vehicles"],
+        "running_buses": counts["running"],
+        "total_drivers": counts["drivers"],
+        "live_buses": len(live),
+        "moving_buses": sum(1 for sp in speeds if sp >= 3),
+        "off_route_buses": sum(1 for p in live if p.get("off_route")),
+        "avg_live_speed_kmph": round(sum(speeds) / len(speeds), 1) if speeds else None,
+        "live_window_min": DASHBOARD_LIVE_WINDOW_MIN,
+        "ingest_fixes_per_s": round(report_policy.rate(now), 2)
     })
 
 
@@ -631,21 +1759,85 @@ def admin_list_stops():
 @app.route("/api/admin/drivers")
 @admin_required
 def admin_list_drivers():
-    drivers = Driver.query.all()
     result = []
-    for d in drivers:
-        svc_info = None
-        if d.assigned_service_id:
-            svc = Service.query.get(d.assigned_service_id)
-            if svc:
-                svc_info = {"service_id": svc.service_id, "service_no": svc.service_no}
+    for row in _driver_record_query().order_by(Driver.id).all():
+        record = _driver_record(row)
+        svc = record["assigned_service"]
         result.append({
-            "id": d.id,
-            "username": d.username,
-            "assigned_service": svc_info
+            "id": record["driver_id"],
+            "username": record["username"],
+            "assigned_service": {"service_id": svc["service_id"], "service_no": svc["service_no"]} if svc else None
         })
     return jsonify(result)
 
+def _parse_time_ms(value, default_ms):
+    """Epoch milliseconds or a 'YYYY-MM-DD HH:MM:SS' / 'YYYY-MM-DD' local time string."""
+    if not value:
+        return default_ms
+    if value.isdigit():
+        return int(value)
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return int(time.mktime(time.strptime(value, fmt)) * 1000)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised time: {value}")
+
+@app.route("/api/admin/history/<service_no>")
+@admin_required
+def admin_location_history(service_no):
+    """
+    Recorded fixes for a service's vehicle in a time range (max 7 days).
+    Query params: from, to — epoch ms or 'YYYY-MM-DD[ HH:MM:SS]'. Defaults to the last hour.
+    """
+    now_ms = int(time.time() * 1000)
+    try:
+        end_ms = _parse_time_ms(request.args.get("to"), now_ms)
+        start_ms = _parse_time_ms(request.args.get("from"), end_ms - 3600 * 1000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if end_ms < start_ms or end_ms - start_ms > 7 * 86400 * 1000:
+        return jsonify({"error": "Range must be positive and at most 7 days"}), 400
+
+    vehicle_id = resolve_vehicle_id(service_no)
+    if vehicle_id is None:
+        return jsonify({"error": "Service/Vehicle not found"}), 404
+
+    fixes = fix_log.read(vehicle_id, start_ms, end_ms)
+    return jsonify({
+        "service_no": service_no,
+        "vehicle_id": vehicle_id,
+        "from": start_ms,
+        "to": end_ms,
+        "count": len(fixes),
+        "fixes": [{"ts": ts, "lat": lat, "lng": lng, "speed": speed} for ts, lat, lng, speed in fixes]
+    })
+
+@app.route("/api/admin/cache_stats")
+@admin_required
+def admin_cache_stats():
+    """Response cache hit/miss counters of this worker, per endpoint, and its GPS filter verdicts."""
+    return jsonify({
+        "backend": "shared" if CACHE_SHARED else "local",
+        "pid": os.getpid(),
+        "versions": data_versions.snapshot(),
+        "endpoints": cache.cache.stats(),
+        "coalesced_waits": single_flight.coalesced,
+        "stale_served": single_flight.stale_served,
+        "gps_filter": dict(fix_filter.counters)
+    })
+
+@app.route("/api/admin/travel_model", methods=["GET", "POST"])
+@admin_required
+def admin_travel_model():
+    """GET: model stats. POST: start a rebuild from the fix log in the background."""
+    if request.method == "POST":
+        if _travel_model_job["running"]:
+            return jsonify({"error": "A rebuild is already running"}), 409
+        socketio.start_background_task(run_travel_model_rebuild)
+        return jsonify({"message": "Rebuild started", **travel_model.stats()}), 202
+    return jsonify(travel_model.stats())
+
 # ── Create ──
 @app.route("/api/admin/add_route", methods=["POST"])
 @admin_required
@@ -654,7 +1846,8 @@ def add_route():
     r = Route(route_name=data["route_name"], from_station=data["from"], to_station=data["to"])
     db.session.add(r)
     db.session.commit()
-    cache.clear()
+    dashboard_counters.adjust("routes", 1)
+    data_changed("route")
     return jsonify({"message": "Route added successfully", "route_id": r.route_id})
 
 @app.route("/api/admin/add_service", methods=["POST"])
@@ -669,7 +1862,8 @@ def add_service():
     )
     db.session.add(s)
     db.session.commit()
-    cache.clear()
+    dashboard_counters.adjust("services", 1)
+    data_changed("service")
     return jsonify({"message": "Service added successfully", "service_id": s.service_id})
 
 @app.route("/api/admin/add_vehicle", methods=["POST"])
@@ -679,7 +1873,10 @@ def add_vehicle():
     v = Vehicle(vehicle_no=data["vehicle_no"], service_id=data["service_id"], status=data.get("status", "Running"))
     db.session.add(v)
     db.session.commit()
-    cache.clear()
+    dashboard_counters.adjust("vehicles", 1)
+    if v.status == 'Running':
+        dashboard_counters.adjust("running", 1)
+    data_changed("vehicle")
     return jsonify({"message": "Vehicle added successfully", "vehicle_id": v.vehicle_id})
 
 @app.route("/api/admin/add_stop", methods=["POST"])
@@ -695,7 +1892,7 @@ def add_stop():
     )
     db.session.add(st)
     db.session.commit()
-    cache.clear()
+    data_changed("stop")
     return jsonify({"message": "Stop added successfully", "stop_id": st.stop_id})
 
 @app.route("/api/admin/assign_driver", methods=["POST"])
@@ -718,6 +1915,7 @@ def assign_driver():
         driver.assigned_service_id = None
 
     db.session.commit()
+    data_changed("driver")
     return jsonify({"message": "Driver assignment updated"})
 
 # ── Delete ──
@@ -729,7 +1927,8 @@ def delete_route(route_id):
         return jsonify({"error": "Route not found"}), 404
     db.session.delete(r)
     db.session.commit()
-    cache.clear()
+    dashboard_counters.adjust("routes", -1)
+    data_changed("route", "service", "stop")  # children keep a NULL route_id
     return jsonify({"message": "Route deleted"})
 
 @app.route("/api/admin/delete_service/<int:service_id>", methods=["DELETE"])
@@ -738,9 +1937,12 @@ def delete_service(service_id):
     s = Service.query.get(service_id)
     if not s:
         return jsonify({"error": "Service not found"}), 404
+    live_store.forget_service(s.service_no)
+    delta_stream.forget_service(s.service_no)
     db.session.delete(s)
     db.session.commit()
-    cache.clear()
+    dashboard_counters.adjust("services", -1)
+    data_changed("service", "vehicle", "driver")  # vehicles/assignments keep a NULL service_id
     return jsonify({"message": "Service deleted"})
 
 @app.route("/api/admin/delete_vehicle/<int:vehicle_id>", methods=["DELETE"])
@@ -749,9 +1951,15 @@ def delete_vehicle(vehicle_id):
     v = Vehicle.query.get(vehicle_id)
     if not v:
         return jsonify({"error": "Vehicle not found"}), 404
+    live_store.forget_vehicle(vehicle_id)
+    fix_filter.forget(vehicle_id)
+    was_running = v.status == 'Running'
     db.session.delete(v)
     db.session.commit()
-    cache.clear()
+    dashboard_counters.adjust("vehicles", -1)
+    if was_running:
+        dashboard_counters.adjust("running", -1)
+    data_changed("vehicle")
     return jsonify({"message": "Vehicle deleted"})
 
 @app.route("/api/admin/delete_stop/<int:stop_id>", methods=["DELETE"])
@@ -762,7 +1970,7 @@ def delete_stop(stop_id):
         return jsonify({"error": "Stop not found"}), 404
     db.session.delete(st)
     db.session.commit()
-    cache.clear()
+    data_changed("stop")
     return jsonify({"message": "Stop deleted"})
 
 @app.route("/api/admin/delete_driver/<int:driver_id>", methods=["DELETE"])
@@ -773,6 +1981,8 @@ def delete_driver(driver_id):
         return jsonify({"error": "Driver not found"}), 404
     db.session.delete(d)
     db.session.commit()
+    dashboard_counters.adjust("drivers", -1)
+    data_changed("driver")
     return jsonify({"message": "Driver deleted"})
 
 # ── Admin Create Admin User ──
@@ -804,4 +2014,4 @@ def create_admin_user():
 if __name__ == "__main__":
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_ENV', 'development') != 'production'
-    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
+    socketio.run(app, host='0.0.0.0', port=port, debug=debug, allow_unsafe_werkzeug=True)
\ No newline at end of file
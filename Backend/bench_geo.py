@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: scalar haversine loops vs the NumPy batch kernels in geo.py.
+
+Runs the two workloads the ETA engine cares about for route sizes 2..500 stops:
+  * nearest stop for a fleet of bus positions (many points -> many stops)
+  * projection of the same positions onto the route polyline
+
+Usage:  python bench_geo.py [--fleet 200] [--repeat 5]
+"""
+import argparse
+import random
+import timeit
+
+import geo
+
+ROUTE_SIZES = [2, 5, 10, 25, 50, 100, 250, 500]
+
+
+def make_route(n, seed=0):
+    rng = random.Random(seed)
+    lat, lng = 17.6868, 83.2185  # Visakhapatnam
+    lats, lngs, cum = [], [], [0.0]
+    for i in range(n):
+        lat += rng.uniform(-0.004, 0.006)
+        lng += rng.uniform(-0.004, 0.006)
+        lats.append(lat)
+        lngs.append(lng)
+        if i:
+            cum.append(cum[-1] + geo.haversine(lats[i - 1], lngs[i - 1], lat, lng))
+    return lats, lngs, cum
+
+
+def make_fleet(lats, lngs, k, seed=1):
+    rng = random.Random(seed)
+    idx = [rng.randrange(len(lats)) for _ in range(k)]
+    return ([lats[i] + rng.uniform(-0.002, 0.002) for i in idx],
+            [lngs[i] + rng.uniform(-0.002, 0.002) for i in idx])
+
+
+def best_of(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fleet", type=int, default=200, help="bus positions per pass")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if not geo.HAS_NUMPY:
+        print("[WARNING] NumPy not installed — only the scalar path will be timed.")
+
+    print(f"Fleet of {args.fleet} positions, best of {args.repeat} (ms)")
+    print(f"{'stops':>6} | {'nearest scalar':>14} | {'nearest numpy':>13} | {'project scalar':>14} | {'project numpy':>13} | {'max |Δ| km':>10}")
+    print("-" * 86)
+    for n in ROUTE_SIZES:
+        lats, lngs, cum = make_route(n)
+        plats, plngs = make_fleet(lats, lngs, args.fleet)
+
+        ns = best_of(lambda: geo.nearest_points(plats, plngs, lats, lngs, use_numpy=False), args.repeat)
+        ps = best_of(lambda: geo.project_onto_polyline(plats, plngs, lats, lngs, cum, use_numpy=False), args.repeat)
+
+        if geo.HAS_NUMPY:
+            nn = best_of(lambda: geo.nearest_points(plats, plngs, lats, lngs, use_numpy=True), args.repeat)
+            pn = best_of(lambda: geo.project_onto_polyline(plats, plngs, lats, lngs, cum, use_numpy=True), args.repeat)
+            _, d_s = geo.nearest_points(plats, plngs, lats, lngs, use_numpy=False)
+            _, d_n = geo.nearest_points(plats, plngs, lats, lngs, use_numpy=True)
+            delta = max(abs(a - b) for a, b in zip(d_s, d_n))
+        else:
+            nn = pn = delta = float('nan')
+
+        print(f"{n:>6} | {ns:>14.3f} | {nn:>13.3f} | {ps:>14.3f} | {pn:>13.3f} | {delta:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
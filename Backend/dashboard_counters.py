@@ -0,0 +1,42 @@
+import threading
+
+
+class DashboardCounters:
+    """
+    Row counts for the admin dashboard, kept up to date by the admin endpoints.
+
+    Every count starts stale and is loaded with one COUNT query the first time
+    it is read. After that, creates and deletes call adjust() and reads cost
+    nothing. invalidate() marks counts stale again, e.g. when another worker
+    changed the data (seen through the shared data versions) or after a reseed.
+    Each stale count is loaded once, by itself.
+    """
+
+    def __init__(self, loaders):
+        self._loaders = loaders    # name -> callable returning the current count
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._stale = set(loaders)
+
+    def adjust(self, name, delta):
+        with self._lock:
+            if name not in self._stale:
+                self._counts[name] += delta
+
+    def invalidate(self, *names):
+        with self._lock:
+            self._stale.update(names)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._stale.update(self._loaders)
+
+    def get(self):
+        with self._lock:
+            stale = list(self._stale)
+        for name in stale:
+            value = self._loaders[name]()
+            with self._lock:
+                self._counts[name] = value
+                self._stale.discard(name)
+        return dict(self._counts)
@@ -0,0 +1,102 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+_SLOT = struct.Struct("<q")
+
+
+class DataVersions:
+    """
+    One counter per entity type (route, service, ...), bumped on every write.
+
+    Cached views put the versions of the entities they read into their cache
+    key, so a write invalidates exactly the dependent entries in O(1): the old
+    keys are never asked for again and age out of the cache on their own.
+
+    With a path the counters live in a small memory-mapped file, so every
+    worker on the host sees a bump immediately; reads are plain memory reads
+    and bumps are serialized with flock.
+
+    New counters start at the current time in milliseconds rather than zero,
+    so a version never repeats across restarts (in-process counters) or a
+    recreated file; anything stamped with an old version stays outdated.
+    """
+
+    def __init__(self, entities, path=None):
+        self._names = tuple(entities)
+        self._slot = {name: i * _SLOT.size for i, name in enumerate(self._names)}
+        self._lock = threading.Lock()
+        self.path = path
+        self._fd = None
+        self._fd_pid = None
+        size = _SLOT.size * len(self._names)
+        if path:
+            import fcntl
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                existing = os.fstat(fd).st_size
+                if existing < size:
+                    os.ftruncate(fd, size)
+                self._mem = mmap.mmap(fd, size)
+                self._start_new_slots(existing)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)  # mmap keeps a dup of fd, so closing it would not unlock
+                os.close(fd)
+        else:
+            self._mem = bytearray(size)
+            self._start_new_slots(0)
+
+    def _start_new_slots(self, initialized_bytes):
+        base = int(time.time() * 1000)
+        for offset in self._slot.values():
+            if offset >= initialized_bytes:
+                _SLOT.pack_into(self._mem, offset, base)
+
+    def _lock_fd(self):
+        # flock belongs to the open file description, which forked workers share,
+        # so each process opens its own
+        if self._fd_pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR)
+            self._fd_pid = os.getpid()
+        return self._fd
+
+    def get(self, entity):
+        return _SLOT.unpack_from(self._mem, self._slot[entity])[0]
+
+    def bump(self, *entities):
+        """Increment the entities' versions; returns {name: new version}."""
+        with self._lock:
+            if self.path:
+                import fcntl
+                fd = self._lock_fd()
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                bumped = {}
+                for name in entities:
+                    bumped[name] = self.get(name) + 1
+                    _SLOT.pack_into(self._mem, self._slot[name], bumped[name])
+                return bumped
+            finally:
+                if self.path:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def key(self, *entities):
+        """'route=3,stop=7' — the version part of a cache key."""
+        return ",".join(f"{name}={self.get(name)}" for name in entities)
+
+    def snapshot(self):
+        return {name: self.get(name) for name in self._names}
+
+    def changed(self, seen):
+        """Entity types whose version differs from seen ({name: version}); updates seen in place."""
+        out = []
+        for name in self._names:
+            current = self.get(name)
+            if seen.get(name) != current:
+                seen[name] = current
+                out.append(name)
+        return out
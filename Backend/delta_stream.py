@@ -0,0 +1,114 @@
+import threading
+import time
+
+# Positions travel as integers in 1e-5 degrees (~1.1 m)
+DELTA_SCALE = 100_000
+
+
+class _Subscriber:
+    __slots__ = ("min_gap", "last_sent_at", "seq", "sent_version", "acked", "frames", "since_key")
+
+    def __init__(self, min_gap):
+        self.min_gap = min_gap
+        self.last_sent_at = 0.0
+        self.seq = 0
+        self.sent_version = -1
+        self.acked = None          # (seq, lat_i, lng_i, speed, t) the client confirmed
+        self.frames = {}           # seq -> quantized state, for frames not yet acknowledged
+        self.since_key = 0
+
+
+class DeltaStream:
+    """
+    Per-subscriber coalesced, delta-encoded position frames.
+
+    publish() only records the latest position of a service. due_frames() is
+    polled by one background loop and returns at most one frame per
+    subscriber and service every 1/max_fps seconds, so bursts of fixes collapse
+    into the newest one.
+
+    Frames are either keyframes
+        {"s": service_no, "q": seq, "k": 1, "lat": int, "lng": int, "v": speed, "t": epoch_s}
+    or deltas against a frame the client acknowledged
+        {"s": service_no, "q": seq, "b": base_seq, "dlat": int, "dlng": int, "dv": int, "dt": int}
+    with zero fields left out. lat/lng are in 1e-5 degrees; clients keep the
+    decoded state of their last keyframe_every frames by seq. A keyframe goes out
+    when there is no acknowledged base yet and after every keyframe_every frames,
+    so a client that missed frames recovers on its own.
+    """
+
+    def __init__(self, max_fps=1.0, keyframe_every=20):
+        self.max_fps = max_fps
+        self.keyframe_every = keyframe_every
+        self._lock = threading.Lock()
+        self._latest = {}          # service_no -> (version, lat_i, lng_i, speed, t)
+        self._subs = {}            # (sid, service_no) -> _Subscriber
+        self._version = 0
+
+    def __len__(self):
+        return len(self._subs)
+
+    # ── Subscriptions ──
+    def subscribe(self, sid, service_no, max_fps=None):
+        fps = min(max(float(max_fps or self.max_fps), 0.1), self.max_fps)
+        with self._lock:
+            self._subs[(sid, service_no)] = _Subscriber(1.0 / fps)
+
+    def unsubscribe(self, sid, service_no=None):
+        with self._lock:
+            for key in [k for k in self._subs if k[0] == sid and (service_no is None or k[1] == service_no)]:
+                del self._subs[key]
+
+    def ack(self, sid, service_no, seq):
+        with self._lock:
+            sub = self._subs.get((sid, service_no))
+            if sub is None or seq not in sub.frames:
+                return
+            if sub.acked is None or seq > sub.acked[0]:
+                sub.acked = (seq,) + sub.frames[seq]
+            for old in [q for q in sub.frames if q <= seq]:
+                del sub.frames[old]
+
+    # ── Frames ──
+    def publish(self, pos, epoch_s=None):
+        state = (int(round(float(pos["lat"]) * DELTA_SCALE)), int(round(float(pos["lng"]) * DELTA_SCALE)),
+                 int(round(float(pos.get("speed") or 0))), int(epoch_s or time.time()))
+        with self._lock:
+            self._version += 1
+            self._latest[pos["service_no"]] = (self._version,) + state
+
+    def forget_service(self, service_no):
+        with self._lock:
+            self._latest.pop(service_no, None)
+
+    def due_frames(self, now=None):
+        """[(sid, frame)] for every subscriber with a newer position whose frame interval has passed."""
+        now = now or time.time()
+        out = []
+        with self._lock:
+            for (sid, service_no), sub in self._subs.items():
+                latest = self._latest.get(service_no)
+                if latest is None or latest[0] <= sub.sent_version or now - sub.last_sent_at < sub.min_gap:
+                    continue
+                state = latest[1:]
+                sub.seq += 1
+                sub.sent_version = latest[0]
+                sub.last_sent_at = now
+                sub.frames[sub.seq] = state
+                if len(sub.frames) > self.keyframe_every:
+                    sub.frames.pop(min(sub.frames))
+                out.append((sid, self._frame(service_no, sub, state)))
+        return out
+
+    def _frame(self, service_no, sub, state):
+        frame = {"s": service_no, "q": sub.seq}
+        if sub.acked is None or sub.since_key >= self.keyframe_every:
+            sub.since_key = 0
+            frame.update(k=1, lat=state[0], lng=state[1], v=state[2], t=state[3])
+            return frame
+        sub.since_key += 1
+        frame["b"] = sub.acked[0]
+        for name, now_v, base_v in zip(("dlat", "dlng", "dv", "dt"), state, sub.acked[1:]):
+            if now_v != base_v:
+                frame[name] = now_v - base_v
+        return frame
@@ -0,0 +1,34 @@
+import struct
+
+from fix_log import COORD_SCALE
+
+# Wire format for driver fixes and binary socket frames, little-endian, 22 bytes:
+# service_id u32, lat*1e7 i32, lng*1e7 i32, speed*10 km/h u16, epoch_ms i64
+FIX = struct.Struct("<IiiHq")
+# Reply to a binary ingest: verdict u8, next interval in 0.1 s u16, min distance m u16
+ACK = struct.Struct("<BHH")
+
+MIMETYPE = "application/x-apsrtc-fix"
+
+VERDICT_CODES = {"accept": 0, "duplicate": 1, "jump": 2}
+
+
+def encode_fix(service_id, lat, lng, speed, epoch_ms):
+    return FIX.pack(int(service_id), int(round(float(lat) * COORD_SCALE)), int(round(float(lng) * COORD_SCALE)),
+                    max(0, min(int(round(float(speed or 0) * 10)), 65535)), int(epoch_ms))
+
+
+def decode_fixes(blob):
+    """
+    Decode one or more concatenated fixes.
+    Returns [(service_id, lat, lng, speed_kmph, epoch_ms)]; raises ValueError on a torn body.
+    """
+    if not blob or len(blob) % FIX.size:
+        raise ValueError(f"Binary fixes must be a multiple of {FIX.size} bytes")
+    return [(sid, lat / COORD_SCALE, lng / COORD_SCALE, speed / 10.0, ts)
+            for sid, lat, lng, speed, ts in FIX.iter_unpack(blob)]
+
+
+def encode_ack(verdict, report):
+    return ACK.pack(VERDICT_CODES.get(verdict, 0), min(int(report["interval_s"] * 10), 65535),
+                    min(int(report["min_distance_m"]), 65535))
@@ -0,0 +1,142 @@
+import os
+import shutil
+import struct
+import threading
+import time
+
+# epoch_ms, lat*1e7, lng*1e7, speed km/h, 2 pad bytes -> 20 bytes per fix
+RECORD = struct.Struct("<qiiH2x")
+COORD_SCALE = 10_000_000
+
+
+class FixLog:
+    """
+    Append-only GPS history, partitioned as <root>/<YYYY-MM-DD>/<vehicle_id>.bin.
+
+    Each fix is one fixed-width binary record (see RECORD), so a bus reporting
+    every 5 s writes about 350 KB a day. append() only buffers in memory; flush()
+    writes every buffered partition with one open/write per file, and is called
+    from the same background loop that persists the live store.
+    """
+
+    def __init__(self, root, retention_days=30, max_buffer=5000):
+        self.root = root
+        self.retention_days = retention_days
+        self.max_buffer = max_buffer
+        self._lock = threading.Lock()
+        self._buffer = {}          # (day, vehicle_id) -> [packed record]
+        self._buffered = 0
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _day(epoch_ms):
+        return time.strftime("%Y-%m-%d", time.localtime(epoch_ms / 1000.0))
+
+    def _path(self, day, vehicle_id):
+        return os.path.join(self.root, day, f"{vehicle_id}.bin")
+
+    # ── Writes ──
+    def append(self, vehicle_id, epoch_ms, lat, lng, speed):
+        try:
+            record = RECORD.pack(int(epoch_ms), int(round(float(lat) * COORD_SCALE)),
+                                 int(round(float(lng) * COORD_SCALE)), max(0, min(int(speed or 0), 65535)))
+        except (TypeError, ValueError, struct.error):
+            return
+        with self._lock:
+            self._buffer.setdefault((self._day(epoch_ms), vehicle_id), []).append(record)
+            self._buffered += 1
+            overflow = self._buffered >= self.max_buffer
+        if overflow:
+            self.flush()
+
+    def flush(self):
+        """Write buffered records to their partitions. Returns the number written."""
+        with self._lock:
+            pending, self._buffer = self._buffer, {}
+            self._buffered = 0
+        written = 0
+        for (day, vehicle_id), records in pending.items():
+            path = self._path(day, vehicle_id)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "ab") as f:
+                    f.write(b"".join(records))
+                written += len(records)
+            except OSError as e:
+                print(f"[HISTORY] Could not write {path}: {e}", flush=True)
+        if time.time() - self._last_purge > 3600:
+            self.purge()
+        return written
+
+    def purge(self, now=None):
+        """Delete day partitions older than retention_days. Returns the days removed."""
+        self._last_purge = now or time.time()
+        if self.retention_days <= 0 or not os.path.isdir(self.root):
+            return []
+        cutoff = time.strftime("%Y-%m-%d", time.localtime(self._last_purge - self.retention_days * 86400))
+        removed = []
+        for day in sorted(os.listdir(self.root)):
+            if len(day) == 10 and day < cutoff:
+                shutil.rmtree(os.path.join(self.root, day), ignore_errors=True)
+                removed.append(day)
+        return removed
+
+    # ── Reads ──
+    def read(self, vehicle_id, start_ms, end_ms):
+        """
+        Fixes for one vehicle with start_ms <= epoch_ms <= end_ms, oldest first,
+        including records still waiting in the write buffer.
+        Returns [(epoch_ms, lat, lng, speed)].
+        """
+        days = []
+        t = start_ms
+        while True:
+            day = self._day(t)
+            if day not in days:
+                days.append(day)
+            if t >= end_ms:
+                break
+            t = min(t + 86400 * 1000, end_ms)
+
+        raw = []
+        for day in days:
+            path = self._path(day, vehicle_id)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    raw.append(f.read())
+        with self._lock:
+            for day in days:
+                raw.extend(self._buffer.get((day, vehicle_id), ()))
+
+        out = []
+        for blob in raw:
+            blob = blob[:len(blob) - len(blob) % RECORD.size]  # ignore a torn tail write
+            for ts, lat, lng, speed in RECORD.iter_unpack(blob):
+                if start_ms <= ts <= end_ms:
+                    out.append((ts, lat / COORD_SCALE, lng / COORD_SCALE, speed))
+        out.sort(key=lambda rec: rec[0])
+        return out
+
+    def vehicles(self, day):
+        """vehicle_ids with a partition file for a day."""
+        folder = os.path.join(self.root, day)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(int(name[:-4]) for name in os.listdir(folder) if name.endswith(".bin") and name[:-4].isdigit())
+
+    def read_day(self, day, vehicle_id):
+        """Every flushed fix in one partition, oldest first: [(epoch_ms, lat, lng, speed)]."""
+        path = self._path(day, vehicle_id)
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            blob = f.read()
+        blob = blob[:len(blob) - len(blob) % RECORD.size]
+        out = [(ts, lat / COORD_SCALE, lng / COORD_SCALE, speed) for ts, lat, lng, speed in RECORD.iter_unpack(blob)]
+        out.sort(key=lambda rec: rec[0])
+        return out
+
+    def days(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if len(d) == 10)
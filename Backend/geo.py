@@ -0,0 +1,145 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+
+# ─── Haversine Distance Helper ─────────────────────────
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculate distance in km between two lat/lng points."""
+    R = EARTH_RADIUS_KM
+    dLat = math.radians(lat2 - lat1)
+    dLon = math.radians(lon2 - lon1)
+    a = math.sin(dLat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Initial compass bearing in degrees (0-360) from point 1 to point 2."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dLon = math.radians(lon2 - lon1)
+    x = math.sin(dLon) * math.cos(phi2)
+    y = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dLon)
+    return (math.degrees(math.atan2(x, y)) + 360.0) % 360.0
+
+
+# ─── Batch Kernels (NumPy, with scalar fallback) ───────
+# NumPy is optional: without it every batch function loops over haversine()
+# above, so results are bit-identical to the per-request code path.
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover - depends on deployment
+    np = None
+    HAS_NUMPY = False
+
+
+def haversine_matrix(lats1, lngs1, lats2, lngs2, use_numpy=None):
+    """
+    Distances in km from every point in set 1 to every point in set 2.
+    Returns an (N, M) ndarray with NumPy, otherwise a list of N lists.
+    """
+    if use_numpy is None:
+        use_numpy = HAS_NUMPY
+    if not use_numpy:
+        return [[haversine(a, b, c, d) for c, d in zip(lats2, lngs2)] for a, b in zip(lats1, lngs1)]
+
+    phi1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lam1 = np.radians(np.asarray(lngs1, dtype=float))[:, None]
+    phi2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lam2 = np.radians(np.asarray(lngs2, dtype=float))[None, :]
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lam2 - lam1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def nearest_points(point_lats, point_lngs, lats, lngs, use_numpy=None):
+    """
+    For each query point, the index of and distance to the closest of (lats, lngs).
+    Returns two sequences (indices, distances_km). Ties go to the lowest index.
+    """
+    if use_numpy is None:
+        use_numpy = HAS_NUMPY
+    if not use_numpy:
+        indices, dists = [], []
+        for plat, plng in zip(point_lats, point_lngs):
+            best_i, best_d = 0, float('inf')
+            for i, (la, ln) in enumerate(zip(lats, lngs)):
+                d = haversine(plat, plng, la, ln)
+                if d < best_d:
+                    best_i, best_d = i, d
+            indices.append(best_i)
+            dists.append(best_d)
+        return indices, dists
+
+    d = haversine_matrix(point_lats, point_lngs, lats, lngs, use_numpy=True)
+    idx = np.argmin(d, axis=1)
+    return idx, d[np.arange(d.shape[0]), idx]
+
+
+def project_onto_polyline(point_lats, point_lngs, lats, lngs, cum_km, use_numpy=None):
+    """
+    Snap points onto a polyline (route stops in order).
+
+    Each segment is treated as straight in a local equirectangular plane, which is
+    accurate to well under a metre for city-scale stop spacing. Returns
+    (segment_index, fraction, offset_km, cross_track_km) for every point, where
+    offset_km is the along-route distance from the first vertex using cum_km.
+    """
+    if use_numpy is None:
+        use_numpy = HAS_NUMPY
+    if len(lats) < 2:
+        raise ValueError("A polyline needs at least two vertices")
+
+    if not use_numpy:
+        segs, fracs, offsets, xts = [], [], [], []
+        for plat, plng in zip(point_lats, point_lngs):
+            best = None
+            for i in range(len(lats) - 1):
+                t, x_km = project_segment(plat, plng, lats[i], lngs[i], lats[i + 1], lngs[i + 1])
+                if best is None or x_km < best[2]:
+                    best = (i, t, x_km)
+            i, t, x_km = best
+            segs.append(i)
+            fracs.append(t)
+            offsets.append(cum_km[i] + t * (cum_km[i + 1] - cum_km[i]))
+            xts.append(x_km)
+        return segs, fracs, offsets, xts
+
+    plat = np.asarray(point_lats, dtype=float)[:, None]
+    plng = np.asarray(point_lngs, dtype=float)[:, None]
+    alat = np.asarray(lats[:-1], dtype=float)[None, :]
+    alng = np.asarray(lngs[:-1], dtype=float)[None, :]
+    blat = np.asarray(lats[1:], dtype=float)[None, :]
+    blng = np.asarray(lngs[1:], dtype=float)[None, :]
+    k = np.cos(np.radians(plat)) * (math.pi / 180.0) * EARTH_RADIUS_KM
+    ky = (math.pi / 180.0) * EARTH_RADIUS_KM
+    ax, ay = (alng - plng) * k, (alat - plat) * ky
+    bx, by = (blng - plng) * k, (blat - plat) * ky
+    dx, dy = bx - ax, by - ay
+    seg_len2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(seg_len2 > 0, -(ax * dx + ay * dy) / seg_len2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    cx, cy = ax + t * dx, ay + t * dy
+    xt = np.sqrt(cx * cx + cy * cy)
+    seg = np.argmin(xt, axis=1)
+    rows = np.arange(xt.shape[0])
+    frac = t[rows, seg]
+    cum = np.asarray(cum_km, dtype=float)
+    offset = cum[seg] + frac * (cum[seg + 1] - cum[seg])
+    return seg, frac, offset, xt[rows, seg]
+
+
+def project_segment(plat, plng, alat, alng, blat, blng):
+    """Scalar projection of a point onto segment a-b. Returns (fraction, cross_track_km)."""
+    k = math.cos(math.radians(plat)) * (math.pi / 180.0) * EARTH_RADIUS_KM
+    ky = (math.pi / 180.0) * EARTH_RADIUS_KM
+    ax, ay = (alng - plng) * k, (alat - plat) * ky
+    bx, by = (blng - plng) * k, (blat - plat) * ky
+    dx, dy = bx - ax, by - ay
+    seg_len2 = dx * dx + dy * dy
+    t = 0.0 if seg_len2 <= 0 else -(ax * dx + ay * dy) / seg_len2
+    t = min(max(t, 0.0), 1.0)
+    cx, cy = ax + t * dx, ay + t * dy
+    return t, math.sqrt(cx * cx + cy * cy)
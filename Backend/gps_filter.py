@@ -0,0 +1,119 @@
+import math
+import threading
+
+M_PER_DEG_LAT = 111320.0
+
+ACCEPT = "accept"
+DUPLICATE = "duplicate"
+JUMP = "jump"
+
+
+class _Track:
+    __slots__ = ("t", "lat", "lng", "v_lat", "v_lng", "raw_lat", "raw_lng", "rejects")
+
+    def __init__(self, t, lat, lng):
+        self.t = t
+        self.lat, self.lng = lat, lng
+        self.v_lat = self.v_lng = 0.0      # degrees per second
+        self.raw_lat, self.raw_lng = lat, lng
+        self.rejects = 0
+
+
+class FixFilter:
+    """
+    Per-vehicle streaming filter for raw phone GPS fixes.
+
+    * duplicate — the phone moved less than min_move_m since the last accepted
+      fix and keepalive_s has not passed (parked bus, repeated watchPosition fix)
+    * jump — reaching the fix from the filtered position would need more than
+      max_speed_kmph; after max_rejects consecutive jumps the track is reset to
+      the new position, so a genuine relocation (GPS re-acquired after a tunnel)
+      is accepted
+    * accept — the position is smoothed with an alpha-beta filter (a
+      fixed-gain Kalman filter) and the velocity estimate is kept for dead
+      reckoning
+
+    State is one small object per vehicle, kept in memory.
+    """
+
+    def __init__(self, alpha=0.6, beta=0.1, min_move_m=8.0, keepalive_s=60.0,
+                 max_speed_kmph=120.0, max_rejects=3, reset_gap_s=120.0):
+        self.alpha = alpha
+        self.beta = beta
+        self.min_move_m = min_move_m
+        self.keepalive_s = keepalive_s
+        self.max_speed_kmph = max_speed_kmph
+        self.max_rejects = max_rejects
+        self.reset_gap_s = reset_gap_s
+        self._lock = threading.Lock()
+        self._tracks = {}
+        self.counters = {ACCEPT: 0, DUPLICATE: 0, JUMP: 0}
+
+    @staticmethod
+    def _metres(lat1, lng1, lat2, lng2):
+        """Equirectangular distance — plenty for the few hundred metres between fixes."""
+        dy = (lat2 - lat1) * M_PER_DEG_LAT
+        dx = (lng2 - lng1) * M_PER_DEG_LAT * math.cos(math.radians((lat1 + lat2) / 2.0))
+        return math.hypot(dx, dy)
+
+    def process(self, key, t, lat, lng, speed=None):
+        """
+        Filter one fix taken at epoch seconds t. Every fix of a vehicle must be
+        timed by the same clock (the device's fix time), or dt turns meaningless.
+        Returns (verdict, lat, lng, speed_kmph); lat/lng are smoothed when accepted.
+        A missing speed is filled in from the filter's velocity estimate.
+        """
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            track = self._tracks.get(key)
+            if track is None or t - track.t > self.reset_gap_s:
+                self._tracks[key] = _Track(t, lat, lng)
+                return self._verdict(ACCEPT, lat, lng, speed)
+
+            dt = t - track.t
+            moved = self._metres(track.raw_lat, track.raw_lng, lat, lng)
+            if dt <= 0 or (moved < self.min_move_m and dt < self.keepalive_s):
+                return self._verdict(DUPLICATE, track.lat, track.lng, speed)
+
+            implied_kmph = self._metres(track.lat, track.lng, lat, lng) / dt * 3.6
+            if implied_kmph > self.max_speed_kmph:
+                track.rejects += 1
+                if track.rejects < self.max_rejects:
+                    return self._verdict(JUMP, track.lat, track.lng, speed)
+                self._tracks[key] = _Track(t, lat, lng)
+                return self._verdict(ACCEPT, lat, lng, speed)
+
+            # Alpha-beta update
+            pred_lat = track.lat + track.v_lat * dt
+            pred_lng = track.lng + track.v_lng * dt
+            r_lat, r_lng = lat - pred_lat, lng - pred_lng
+            track.lat = pred_lat + self.alpha * r_lat
+            track.lng = pred_lng + self.alpha * r_lng
+            track.v_lat += (self.beta / dt) * r_lat
+            track.v_lng += (self.beta / dt) * r_lng
+            track.t = t
+            track.raw_lat, track.raw_lng = lat, lng
+            track.rejects = 0
+
+            if speed is None:
+                speed = round(self._speed_kmph(track))
+            return self._verdict(ACCEPT, track.lat, track.lng, speed)
+
+    def _verdict(self, verdict, lat, lng, speed):
+        self.counters[verdict] += 1
+        return verdict, lat, lng, speed
+
+    def _speed_kmph(self, track):
+        return self._metres(0.0, 0.0, track.v_lat, track.v_lng) * 3.6 if track.v_lat or track.v_lng else 0.0
+
+    def predict(self, key, t, max_ahead_s=30.0):
+        """Dead-reckoned (lat, lng) at epoch seconds t, or None for an unknown vehicle."""
+        track = self._tracks.get(key)
+        if track is None:
+            return None
+        dt = min(max(t - track.t, 0.0), max_ahead_s)
+        return track.lat + track.v_lat * dt, track.lng + track.v_lng * dt
+
+    def forget(self, key):
+        with self._lock:
+            self._tracks.pop(key, None)
@@ -0,0 +1,163 @@
+import threading
+import time
+
+
+class LiveStore:
+    """
+    Process-level hot store for the latest fix of every bus.
+
+    Reads (/api/live, /api/eta) are served from memory. Writes are marked
+    dirty and persisted to the live_location table in batches by a
+    background flusher (write-behind), so a fix costs no SQL on ingest.
+
+    With several workers each one only sees the fixes it received itself;
+    with sync_interval > 0 the store is due for a re-read of live_location
+    every sync_interval seconds (see newer_rows).
+    """
+
+    def __init__(self, flush_interval=5.0, sync_interval=0):
+        self.flush_interval = flush_interval
+        self.sync_interval = sync_interval
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._by_vehicle = {}      # vehicle_id -> position dict
+        self._by_service = {}      # service_no -> vehicle_id
+        self._dirty = {}           # vehicle_id -> position dict awaiting flush
+        self._flusher_started = False
+        self.version = 0           # bumped on every change; used in derived cache keys
+        self.warmed = False
+
+    # ── Reads ──
+    def get_vehicle(self, vehicle_id):
+        return self._by_vehicle.get(vehicle_id)
+
+    def get_service(self, service_no):
+        vehicle_id = self._by_service.get(service_no)
+        if vehicle_id is None:
+            return None
+        return self._by_vehicle.get(vehicle_id)
+
+    def vehicle_for(self, service_no):
+        return self._by_service.get(service_no)
+
+    def all(self):
+        with self._lock:
+            return list(self._by_vehicle.values())
+
+    # ── Writes ──
+    def bind(self, service_no, vehicle_id):
+        """Remember which vehicle serves a service_no without storing a fix."""
+        with self._lock:
+            self._by_service[service_no] = vehicle_id
+
+    def put(self, service_no, vehicle_id, lat, lng, speed, updated_at, dirty=True, **extra):
+        """Store a fix. extra carries derived fields (e.g. route progress) kept in memory only."""
+        pos = {
+            "service_no": service_no,
+            "vehicle_id": vehicle_id,
+            "lat": lat,
+            "lng": lng,
+            "speed": speed,
+            "updated_at": updated_at
+        }
+        pos.update(extra)
+        with self._lock:
+            self._by_vehicle[vehicle_id] = pos
+            self._by_service[service_no] = vehicle_id
+            if dirty:
+                self._dirty[vehicle_id] = pos
+            self.version += 1
+        return pos
+
+    def warm(self, rows):
+        """
+        Seed the store from persisted rows (service_no, vehicle_id, lat, lng, speed, updated_at)
+        without overwriting fixes that already arrived in this process.
+        """
+        with self._lock:
+            for service_no, vehicle_id, lat, lng, speed, updated_at in rows:
+                if vehicle_id in self._by_vehicle:
+                    continue
+                self._by_vehicle[vehicle_id] = {
+                    "service_no": service_no,
+                    "vehicle_id": vehicle_id,
+                    "lat": lat,
+                    "lng": lng,
+                    "speed": speed,
+                    "updated_at": updated_at
+                }
+                self._by_service.setdefault(service_no, vehicle_id)
+            self.warmed = True
+            self.version += 1
+
+    def sync_due(self, now=None):
+        return self.sync_interval > 0 and (now or time.time()) - self._synced_at >= self.sync_interval
+
+    def mark_synced(self, now=None):
+        self._synced_at = now or time.time()
+
+    def newer_rows(self, rows):
+        """
+        Persisted rows (as in warm()) newer than this process's copy of the bus,
+        i.e. fixes another worker received. Buses with an unflushed fix here are kept.
+        """
+        with self._lock:
+            out = []
+            for row in rows:
+                vehicle_id, updated_at = row[1], row[5]
+                if vehicle_id in self._dirty or not updated_at:
+                    continue
+                pos = self._by_vehicle.get(vehicle_id)
+                if pos is None or (pos["updated_at"] or "") < updated_at:
+                    out.append(row)
+            return out
+
+    def forget_vehicle(self, vehicle_id):
+        with self._lock:
+            self._by_vehicle.pop(vehicle_id, None)
+            self._dirty.pop(vehicle_id, None)
+            for service_no in [k for k, v in self._by_service.items() if v == vehicle_id]:
+                del self._by_service[service_no]
+            self.version += 1
+
+    def forget_service(self, service_no):
+        with self._lock:
+            vehicle_id = self._by_service.pop(service_no, None)
+            if vehicle_id is not None:
+                self._by_vehicle.pop(vehicle_id, None)
+                self._dirty.pop(vehicle_id, None)
+            self.version += 1
+
+    # ── Write-behind ──
+    def drain_dirty(self):
+        with self._lock:
+            batch = list(self._dirty.values())
+            self._dirty.clear()
+        return batch
+
+    def requeue(self, batch):
+        """Put a failed batch back unless a newer fix has replaced it."""
+        with self._lock:
+            for pos in batch:
+                self._dirty.setdefault(pos["vehicle_id"], pos)
+
+    def pending(self):
+        return len(self._dirty)
+
+    def start_flusher(self, flush_fn, spawn, sleep):
+        """
+        Start the periodic flush loop once per process.
+        spawn/sleep come from the Socket.IO server so the loop is a greenlet
+        under gevent and a thread under the dev server.
+        """
+        with self._lock:
+            if self._flusher_started or self.flush_interval <= 0:
+                return
+            self._flusher_started = True
+
+        def loop():
+            while True:
+                sleep(self.flush_interval)
+                flush_fn()
+
+        spawn(loop)
@@ -0,0 +1,76 @@
+import math
+import threading
+import time
+
+
+class ReportPolicy:
+    """
+    Chooses how often a driver phone should report, returned with every ingest.
+
+    * parked (speed below parked_kmph) — one fix every parked_interval_s
+    * within near_stop_km of the next stop — every min_interval_s, so arrivals
+      and departures are sharp where riders are waiting
+    * moving — roughly one fix every spacing_m along the road, clamped to
+      [min_interval_s, max_interval_s]
+
+    Every interval is stretched by the load factor: the decayed ingest rate of
+    this process divided by target_rate, between 1 and max_load_factor.
+    """
+
+    def __init__(self, min_interval_s=3.0, max_interval_s=15.0, parked_interval_s=30.0,
+                 parked_kmph=3.0, near_stop_km=0.3, spacing_m=150.0, min_distance_m=25.0,
+                 target_rate=50.0, max_load_factor=4.0, window_s=10.0):
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max_interval_s
+        self.parked_interval_s = parked_interval_s
+        self.parked_kmph = parked_kmph
+        self.near_stop_km = near_stop_km
+        self.spacing_m = spacing_m
+        self.min_distance_m = min_distance_m
+        self.target_rate = target_rate
+        self.max_load_factor = max_load_factor
+        self.window_s = window_s
+        self._lock = threading.Lock()
+        self._rate = 0.0           # fixes per second, exponentially decayed over window_s
+        self._rate_at = time.time()
+
+    # ── Load ──
+    def record(self, count=1, now=None):
+        """Count ingested fixes towards the load estimate."""
+        now = now or time.time()
+        with self._lock:
+            self._rate = self._decayed(now) + count / self.window_s
+            self._rate_at = now
+
+    def _decayed(self, now):
+        return self._rate * math.exp(-max(now - self._rate_at, 0.0) / self.window_s)
+
+    def rate(self, now=None):
+        return self._decayed(now or time.time())
+
+    def load_factor(self, now=None):
+        if self.target_rate <= 0:
+            return 1.0
+        return min(max(self.rate(now) / self.target_rate, 1.0), self.max_load_factor)
+
+    # ── Advice ──
+    def advise(self, speed_kmph, stop_km=None, now=None):
+        """{"interval_s", "min_distance_m"} for the device's next report."""
+        try:
+            speed = float(speed_kmph or 0)
+        except (TypeError, ValueError):
+            speed = 0.0
+
+        if speed < self.parked_kmph:
+            interval, distance = self.parked_interval_s, self.min_distance_m
+        elif stop_km is not None and stop_km <= self.near_stop_km:
+            interval, distance = self.min_interval_s, self.min_distance_m / 2.0
+        else:
+            interval = min(max(self.spacing_m / (speed / 3.6), self.min_interval_s), self.max_interval_s)
+            distance = self.min_distance_m
+
+        factor = self.load_factor(now)
+        return {
+            "interval_s": round(min(interval * factor, self.parked_interval_s * self.max_load_factor), 1),
+            "min_distance_m": round(distance * factor)
+        }
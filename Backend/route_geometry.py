@@ -0,0 +1,158 @@
+import math
+import threading
+from array import array
+from bisect import bisect_right
+
+from geo import haversine, bearing, project_segment
+
+SEG_CELL_DEG = 0.02          # segment index bucket (~2.2 km)
+SEG_MAX_CELLS = 400          # longer segments skip the grid and are always checked
+BACKTRACK_PENALTY_KM = 1.0   # bias against snapping behind the previous along-route offset
+
+
+class RouteGeometry:
+    """
+    Immutable, precomputed geometry for one route.
+
+    Stops are held as parallel compact arrays in stop_order. cum_km[i] is the
+    along-route distance from the first stop to stop i, so the distance between
+    any two stops is a subtraction. bearings[i] is the heading of segment i -> i+1.
+    """
+
+    __slots__ = ("route_id", "stop_ids", "names", "lats", "lngs", "cum_km", "bearings", "_name_index",
+                 "_seg_cells", "_long_segs")
+
+    def __init__(self, route_id, stops):
+        self.route_id = route_id
+        self.stop_ids = array('l', [st.stop_id for st in stops])
+        self.names = tuple(st.stop_name for st in stops)
+        self.lats = array('d', [st.lat for st in stops])
+        self.lngs = array('d', [st.lng for st in stops])
+
+        cum = array('d', [0.0] * len(stops))
+        bearings = array('d', [0.0] * max(len(stops) - 1, 0))
+        for i in range(1, len(stops)):
+            cum[i] = cum[i - 1] + haversine(self.lats[i - 1], self.lngs[i - 1], self.lats[i], self.lngs[i])
+            bearings[i - 1] = bearing(self.lats[i - 1], self.lngs[i - 1], self.lats[i], self.lngs[i])
+        self.cum_km = cum
+        self.bearings = bearings
+
+        # First occurrence wins, matching the old linear name scan
+        self._name_index = {}
+        for i, name in enumerate(self.names):
+            self._name_index.setdefault(name.lower(), i)
+
+        # Segment index: cell -> segments whose bbox (plus one cell of margin) covers it
+        self._seg_cells = {}
+        self._long_segs = []
+        for i in range(len(stops) - 1):
+            x0, y0 = self._cell(min(self.lats[i], self.lats[i + 1]), min(self.lngs[i], self.lngs[i + 1]))
+            x1, y1 = self._cell(max(self.lats[i], self.lats[i + 1]), max(self.lngs[i], self.lngs[i + 1]))
+            if (x1 - x0 + 3) * (y1 - y0 + 3) > SEG_MAX_CELLS:
+                self._long_segs.append(i)
+                continue
+            for x in range(x0 - 1, x1 + 2):
+                for y in range(y0 - 1, y1 + 2):
+                    self._seg_cells.setdefault((x, y), []).append(i)
+
+    @staticmethod
+    def _cell(lat, lng):
+        return (int(math.floor(lng / SEG_CELL_DEG)), int(math.floor(lat / SEG_CELL_DEG)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def nearest_stop(self, lat, lng):
+        """Return (index, distance_km) of the stop closest to a point."""
+        min_dist = float('inf')
+        closest_idx = 0
+        lats, lngs = self.lats, self.lngs
+        for i in range(len(lats)):
+            d = haversine(lat, lng, lats[i], lngs[i])
+            if d < min_dist:
+                min_dist = d
+                closest_idx = i
+        return closest_idx, min_dist
+
+    def nearest_of(self, lat, lng, indices):
+        """Like nearest_stop, restricted to a few candidate stop indices."""
+        best = (0, float('inf'))
+        for i in indices:
+            if 0 <= i < len(self.names):
+                d = haversine(lat, lng, self.lats[i], self.lngs[i])
+                if d < best[1]:
+                    best = (i, d)
+        return best
+
+    def project(self, lat, lng, prev_offset=None):
+        """
+        Snap a point onto the route polyline.
+        Returns (segment, fraction, offset_km, cross_track_km), or None for routes
+        with fewer than two stops. Only segments bucketed near the point are
+        tested; a point far from every segment falls back to a full scan.
+        When two segments are about equally close (loops, out-and-back roads),
+        the one not behind prev_offset wins.
+        """
+        if len(self.names) < 2:
+            return None
+        candidates = self._seg_cells.get(self._cell(lat, lng), []) + self._long_segs
+        if not candidates:
+            candidates = range(len(self.names) - 1)
+
+        best, best_score = None, float('inf')
+        for i in candidates:
+            t, cross_km = project_segment(lat, lng, self.lats[i], self.lngs[i], self.lats[i + 1], self.lngs[i + 1])
+            offset = self.cum_km[i] + t * (self.cum_km[i + 1] - self.cum_km[i])
+            score = cross_km
+            if prev_offset is not None and offset < prev_offset - 0.05:
+                score += BACKTRACK_PENALTY_KM
+            if score < best_score:
+                best, best_score = (i, t, offset, cross_km), score
+        return best
+
+    def next_stop_index(self, offset_km, at_stop_km=0.05):
+        """Index of the first stop more than at_stop_km ahead of an along-route offset (len(self) if none)."""
+        return bisect_right(self.cum_km, offset_km + at_stop_km)
+
+    def index_of(self, stop_name):
+        """Index of a stop by case-insensitive name, or None."""
+        return self._name_index.get(stop_name.lower())
+
+    def distance_between(self, i, j):
+        """Along-route distance in km from stop i to stop j (i <= j)."""
+        return self.cum_km[j] - self.cum_km[i]
+
+
+class RouteGeometryCache:
+    """
+    route_id -> RouteGeometry, plus a service_no -> route_id map.
+    Entries are built lazily by the supplied loaders and cleared together
+    whenever routes, stops or services change (invalidate_local_indexes).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._service_routes = {}
+
+    def get(self, route_id, load_stops):
+        geom = self._routes.get(route_id)
+        if geom is None:
+            geom = RouteGeometry(route_id, load_stops(route_id))
+            with self._lock:
+                self._routes[route_id] = geom
+        return geom
+
+    def route_for(self, service_no, load_route_id):
+        if service_no in self._service_routes:
+            return self._service_routes[service_no]
+        route_id = load_route_id(service_no)
+        if route_id is not None:
+            with self._lock:
+                self._service_routes[service_no] = route_id
+        return route_id
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+            self._service_routes.clear()
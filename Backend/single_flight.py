@@ -0,0 +1,85 @@
+import threading
+import time
+
+
+class SingleFlight:
+    """
+    Request coalescing with stale-while-revalidate on top of a flask_caching backend.
+
+    Entries are stored as (value, fresh_until) for ttl + stale_ttl seconds.
+      * fresh — returned as is
+      * stale — returned as is, while exactly one background task rebuilds it
+      * missing — one caller (the leader) builds it; concurrent callers for the
+        same key wait up to wait_timeout for the leader's value instead of
+        running the same queries, then fall back to building it themselves
+
+    Coalescing is per process; with the shared cache tier the other workers
+    still pick the rebuilt value up from L2.
+    """
+
+    def __init__(self, cache, spawn, wait_timeout=10.0):
+        self.cache = cache
+        self.spawn = spawn
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._inflight = {}        # key -> threading.Event set when the rebuild finishes
+        self.coalesced = 0
+        self.stale_served = 0
+
+    def _claim(self, key):
+        """Event to wait on if another caller is already rebuilding key, else None (we lead)."""
+        with self._lock:
+            event = self._inflight.get(key)
+            if event is not None:
+                return event
+            self._inflight[key] = threading.Event()
+            return None
+
+    def _release(self, key):
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def _store(self, key, value, ttl, stale_ttl):
+        self.cache.set(key, (value, time.time() + ttl), timeout=ttl + stale_ttl)
+        return value
+
+    def get(self, key, build, ttl, stale_ttl=0, rebuild=None):
+        """
+        Cached value for key, built with build() on a miss. rebuild is the
+        callable used for background refreshes of stale entries (it must not
+        depend on the current request); without it stale entries count as missing.
+        """
+        entry = self.cache.get(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if time.time() < fresh_until:
+                return value
+            if rebuild is not None:
+                self.stale_served += 1
+                if self._claim(key) is None:
+                    self.spawn(self._refresh, key, rebuild, ttl, stale_ttl)
+                return value
+
+        event = self._claim(key)
+        if event is None:
+            try:
+                return self._store(key, build(), ttl, stale_ttl)
+            finally:
+                self._release(key)
+
+        self.coalesced += 1
+        if event.wait(self.wait_timeout):
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry[0]
+        return self._store(key, build(), ttl, stale_ttl)
+
+    def _refresh(self, key, rebuild, ttl, stale_ttl):
+        try:
+            self._store(key, rebuild(), ttl, stale_ttl)
+        except Exception as e:
+            print(f"[CACHE] Background refresh of {key} failed: {e}", flush=True)
+        finally:
+            self._release(key)
@@ -0,0 +1,142 @@
+import math
+import threading
+
+from geo import haversine
+
+KM_PER_DEG_LAT = 111.32
+
+
+class GridIndex:
+    """
+    Uniform lat/lng bucket grid for radius and k-nearest queries.
+
+    Every key lives in exactly one cell; move() only touches the buckets when
+    the point crosses a cell boundary, so it is cheap enough to call on every
+    GPS fix. The default cell (0.01°) is roughly 1.1 km at Andhra Pradesh
+    latitudes, which keeps a 1-2 km radius query to a handful of buckets.
+    """
+
+    def __init__(self, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._cells = {}           # (cx, cy) -> set(key)
+        self._points = {}          # key -> (lat, lng, cell, data)
+        self.ready = False         # set by load(); lets callers build the index lazily
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lng / self.cell_deg)), int(math.floor(lat / self.cell_deg)))
+
+    # ── Writes ──
+    def move(self, key, lat, lng, data=None):
+        """Insert or relocate a key. Returns True if it changed cell."""
+        cell = self._cell(lat, lng)
+        with self._lock:
+            old = self._points.get(key)
+            if data is None and old is not None:
+                data = old[3]
+            self._points[key] = (lat, lng, cell, data)
+            if old is not None and old[2] == cell:
+                return False
+            if old is not None:
+                bucket = self._cells.get(old[2])
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._cells[old[2]]
+            self._cells.setdefault(cell, set()).add(key)
+            return True
+
+    def load(self, items):
+        """Replace the contents with (key, lat, lng, data) tuples."""
+        self.clear()
+        for key, lat, lng, data in items:
+            self.move(key, lat, lng, data)
+        self.ready = True
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+            self.ready = False
+
+    # ── Queries ──
+    def _ring(self, cx, cy, r):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-r, r + 1):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+        for dy in range(-r + 1, r):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+
+    def _collect(self, cells, lat, lng, radius_km, out, box=None):
+        for cell in cells:
+            for key in self._cells.get(cell, ()):
+                plat, plng, _, data = self._points[key]
+                if box is not None and not (box[0] <= plat <= box[2] and box[1] <= plng <= box[3]):
+                    continue
+                d = haversine(lat, lng, plat, plng)
+                if radius_km is None or d <= radius_km:
+                    out.append((d, key, data))
+
+    def _cells_in(self, x0, y0, x1, y1):
+        """Cells in a range; scans occupied cells instead when the range is larger."""
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            return [c for c in self._cells if x0 <= c[0] <= x1 and y0 <= c[1] <= y1]
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+    def within(self, lat, lng, radius_km, limit=None):
+        """All keys within radius_km, nearest first: [(distance_km, key, data)]."""
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlng = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        x0, y0 = self._cell(lat - dlat, lng - dlng)
+        x1, y1 = self._cell(lat + dlat, lng + dlng)
+        out = []
+        with self._lock:
+            self._collect(self._cells_in(x0, y0, x1, y1), lat, lng, radius_km, out)
+        out.sort(key=lambda item: item[0])
+        return out[:limit] if limit else out
+
+    def within_box(self, min_lat, min_lng, max_lat, max_lng, limit=None):
+        """Keys inside a bounding box, nearest to the box centre first."""
+        center = ((min_lat + max_lat) / 2.0, (min_lng + max_lng) / 2.0)
+        x0, y0 = self._cell(min_lat, min_lng)
+        x1, y1 = self._cell(max_lat, max_lng)
+        out = []
+        with self._lock:
+            self._collect(self._cells_in(x0, y0, x1, y1), center[0], center[1], None, out,
+                          box=(min_lat, min_lng, max_lat, max_lng))
+        out.sort(key=lambda item: item[0])
+        return out[:limit] if limit else out
+
+    def nearest(self, lat, lng, k=10, max_radius_km=50.0):
+        """
+        k nearest keys within max_radius_km, by expanding rings of cells around
+        the query point. Stops once the k-th hit is closer than anything an outer
+        ring could hold, or once a ring would cover more cells than are occupied.
+        """
+        cx, cy = self._cell(lat, lng)
+        cell_km = self.cell_deg * KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6)
+        max_ring = int(math.ceil(max_radius_km / cell_km)) + 1
+        out = []
+        with self._lock:
+            r = 0
+            while r <= max_ring:
+                if (2 * r + 1) ** 2 > len(self._cells):
+                    # Cheaper to finish off with every occupied cell outside the rings seen so far
+                    rest = [c for c in self._cells if max(abs(c[0] - cx), abs(c[1] - cy)) >= r]
+                    self._collect(rest, lat, lng, max_radius_km, out)
+                    break
+                self._collect(self._ring(cx, cy, r), lat, lng, max_radius_km, out)
+                if len(out) >= k:
+                    out.sort(key=lambda item: item[0])
+                    if out[k - 1][0] <= r * cell_km:
+                        break
+                r += 1
+        out.sort(key=lambda item: item[0])
+        return out[:k]
@@ -0,0 +1,66 @@
+import json
+import queue
+import threading
+
+
+class SSEBroker:
+    """
+    In-process fan-out of location updates to Server-Sent Events streams.
+
+    Each open stream owns a one-slot queue: when a client is slower than the
+    bus, the unsent position is replaced by the newer one instead of piling up.
+    Under the gevent worker the blocking queue get only parks the greenlet.
+    """
+
+    def __init__(self, max_clients=500):
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._streams = {}         # service_no -> set(queue.Queue)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, service_no):
+        """A queue receiving the service's updates, or None when max_clients are connected."""
+        q = queue.Queue(maxsize=1)
+        with self._lock:
+            if self._count >= self.max_clients:
+                return None
+            self._streams.setdefault(service_no, set()).add(q)
+            self._count += 1
+        return q
+
+    def unsubscribe(self, service_no, q):
+        with self._lock:
+            streams = self._streams.get(service_no)
+            if streams is None or q not in streams:
+                return
+            streams.discard(q)
+            self._count -= 1
+            if not streams:
+                del self._streams[service_no]
+
+    def publish(self, service_no, payload):
+        streams = self._streams.get(service_no)
+        if not streams:
+            return
+        with self._lock:
+            targets = list(streams)
+        for q in targets:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                pass
+
+    @staticmethod
+    def format_event(payload, event="location_update", event_id=None):
+        lines = [f"event: {event}"]
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        lines.append("data: " + json.dumps(payload, separators=(",", ":")))
+        return "\n".join(lines) + "\n\n"
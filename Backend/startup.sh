@@ -3,12 +3,19 @@
 # Set this as the Startup Command in: App Service → Configuration → General Settings
 #
 # Startup Command to paste in Azure Portal:
-#   gunicorn --bind=0.0.0.0:$PORT --timeout 600 --workers 2 --threads 2 backend:app
+#   gunicorn --bind=0.0.0.0:$PORT --worker-class geventwebsocket.gunicorn.workers.GeventWebSocketWorker --workers 1 --timeout 600 backend:app
+#
+# Socket.IO long-polling needs sticky sessions, so keep a single gevent worker
+# unless SOCKETIO_MESSAGE_QUEUE is set and the load balancer pins clients.
+# With more than one worker, set CACHE_BACKEND=shared so workers share cached
+# responses and see each other's admin writes. Bus positions then reach the other
+# workers through live_location, up to LIVE_FLUSH_INTERVAL + LIVE_STORE_SYNC_S
+# seconds late.
 
 gunicorn --bind=0.0.0.0:${PORT:-8000} \
+         --worker-class geventwebsocket.gunicorn.workers.GeventWebSocketWorker \
          --timeout 600 \
-         --workers 2 \
-         --threads 2 \
+         --workers ${WEB_CONCURRENCY:-1} \
          --access-logfile '-' \
          --error-logfile '-' \
          backend:app
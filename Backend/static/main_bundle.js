@@ -6,6 +6,7 @@ let routeRoadPath = [];   // Stores the OSRM road-following coordinates for the
 let routePolyline = null;
 let lastReachedStopIndex = 0;
 let socket = null;         // WebSocket connection
+let liveStream = null;     // EventSource fallback when the WebSocket is unavailable
 let currentTrackingService = null;  // Currently tracked service number
 let notificationSent = {};  // Track which notifications have been sent
 
@@ -82,10 +83,37 @@ function leaveTrackingRoom() {
         socket.emit('leave_tracking', { service_no: currentTrackingService });
         console.log(`[WS] Left room: track_${currentTrackingService}`);
     }
+    closeLiveStream();
     currentTrackingService = null;
     notificationSent = {};
 }
 
+// SSE fallback: one long-lived response instead of polling /api/live every 5 s
+function openLiveStream(serviceNo) {
+    if (liveStream) return;
+    liveStream = new EventSource(`${API_BASE}/api/live/${serviceNo}/stream`);
+    liveStream.addEventListener('location_update', (e) => {
+        const data = JSON.parse(e.data);
+        if (data.service_no === currentTrackingService) {
+            handleLiveUpdate(data);
+        }
+    });
+    liveStream.onerror = () => {
+        if (liveStream && liveStream.readyState === EventSource.CLOSED) {
+            liveStream = null;  // reopened or polled on the next fallback tick
+            updateMapLocation(serviceNo);
+        }
+    };
+    console.log(`[SSE] Streaming ${serviceNo}`);
+}
+
+function closeLiveStream() {
+    if (liveStream) {
+        liveStream.close();
+        liveStream = null;
+    }
+}
+
 function handleLiveUpdate(liveData) {
     // Update text info
     const speedEl = document.getElementById("speedValue");
@@ -475,9 +503,13 @@ async function startLiveMap(serviceNo) {
     // 4. Initial Live Location Check
     await updateMapLocation(serviceNo);
 
-    // 5. Fallback polling (in case WebSocket fails or is unavailable)
+    // 5. Fallback (in case WebSocket fails or is unavailable): SSE stream, else polling
     trackingInterval = setInterval(() => {
-        if (!socket || !socket.connected) {
+        if (socket && socket.connected) {
+            closeLiveStream();
+        } else if (window.EventSource) {
+            openLiveStream(serviceNo);
+        } else {
             updateMapLocation(serviceNo);
         }
     }, 5000);
@@ -714,7 +746,8 @@ async function updateETADisplay(serviceNo) {
 
 async function updateMapLocation(serviceNo) {
     try {
-        const res = await fetch(`${API_BASE}/api/live/${serviceNo}?t=${Date.now()}`);
+        // Revalidate with If-None-Match instead of cache-busting, so an unchanged position is a 304
+        const res = await fetch(`${API_BASE}/api/live/${serviceNo}`, { cache: "no-cache" });
         if (!res.ok) {
             const updEl = document.getElementById("updatedValue");
             if (updEl) updEl.innerHTML = `<i class="bi bi-clock-history"></i> Status: Waiting for driver...`;
@@ -2,7 +2,7 @@
 // APSRTC Live — Service Worker (PWA Offline Support)
 // ═══════════════════════════════════════════════════════
 
-const CACHE_NAME = 'apsrtc-live-v10';
+const CACHE_NAME = 'apsrtc-live-v12';
 const STATIC_ASSETS = [
     '/',
     '/static/style.css',
@@ -53,6 +53,9 @@ self.addEventListener('fetch', (event) => {
     // Skip non-GET requests (POST for location updates, etc.)
     if (event.request.method !== 'GET') return;
 
+    // Never cache Server-Sent Events streams — the response never ends
+    if (event.request.headers.get('accept')?.includes('text/event-stream')) return;
+
     // API calls — Network first, fallback to cache
     if (url.pathname.startsWith('/api/')) {
         event.respondWith(
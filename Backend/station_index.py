@@ -0,0 +1,151 @@
+import re
+import threading
+from bisect import bisect_left
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    """'RTC Bus-Complex ' -> 'rtc bus complex'"""
+    return _NON_ALNUM.sub(" ", (text or "").lower()).strip()
+
+
+def trigrams(norm):
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StationIndex:
+    """
+    In-process name index for station/stop autocomplete and search.
+
+    Each distinct name gets a canonical integer id. Lookups use four
+    structures built once per load():
+      * a sorted list of every word-suffix of each normalized name, for
+        whole-name and word-start prefix search via bisect;
+      * a trigram -> ids posting map over normalized names, for substring
+        and typo-tolerant ranking in suggest();
+      * a trigram -> ids posting map over lowercased names, for the literal
+        substring matching of resolve();
+      * the exact normalized form -> ids.
+    """
+
+    def __init__(self, fuzzy_threshold=0.35):
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        self.ready = False
+        self._names = []           # id -> canonical name
+        self._norms = []           # id -> normalized name
+        self._exact = {}           # normalized name -> [id]
+        self._suffixes = []        # sorted [(word-suffix, id)]
+        self._grams = {}           # trigram -> set(id)
+        self._lowers = []          # id -> lowercased name
+        self._literal_grams = {}   # trigram of the lowercased name -> set(id)
+
+    def load(self, names):
+        canonical = sorted({n for n in names if n})
+        norms = [normalize(n) for n in canonical]
+        exact, suffixes, grams = {}, [], {}
+        for sid, norm in enumerate(norms):
+            exact.setdefault(norm, []).append(sid)
+            words = norm.split(" ")
+            for w in range(len(words)):
+                suffixes.append((" ".join(words[w:]), sid))
+            for g in trigrams(norm):
+                grams.setdefault(g, set()).add(sid)
+        suffixes.sort()
+        lowers = [n.lower() for n in canonical]
+        literal_grams = {}
+        for sid, lower in enumerate(lowers):
+            for i in range(len(lower) - 2):
+                literal_grams.setdefault(lower[i:i + 3], set()).add(sid)
+        with self._lock:
+            self._names, self._norms = canonical, norms
+            self._exact, self._suffixes, self._grams = exact, suffixes, grams
+            self._lowers, self._literal_grams = lowers, literal_grams
+            self.ready = True
+
+    def invalidate(self):
+        with self._lock:
+            self.ready = False
+
+    def names(self):
+        return list(self._names)
+
+    # ── Lookups ──
+    def _prefix_ids(self, q):
+        """ids whose normalized name has a word starting with q -> {id: starts_whole_name}"""
+        hits = {}
+        i = bisect_left(self._suffixes, (q, -1))
+        while i < len(self._suffixes) and self._suffixes[i][0].startswith(q):
+            suffix, sid = self._suffixes[i]
+            hits[sid] = hits.get(sid, False) or self._norms[sid].startswith(q)
+            i += 1
+        return hits
+
+    def _substring_ids(self, q):
+        if len(q) < 3:
+            return [sid for sid, norm in enumerate(self._norms) if q in norm]
+        grams = [self._grams.get(g, set()) for g in trigrams(q) if not g.startswith(" ") and not g.endswith(" ")]
+        if not grams:
+            return [sid for sid, norm in enumerate(self._norms) if q in norm]
+        candidates = set.intersection(*sorted(grams, key=len))
+        return [sid for sid in candidates if q in self._norms[sid]]
+
+    def _similarity(self, q_grams, sid):
+        s_grams = trigrams(self._norms[sid])
+        return len(q_grams & s_grams) / float(len(q_grams | s_grams))
+
+    def resolve(self, text):
+        """
+        Canonical names containing text case-insensitively, for use in an IN (...)
+        filter: the rows ilike('%text%') matches. Returns None for empty text (no
+        filter). Punctuation and whitespace are taken literally; normalized and
+        typo-tolerant matching is left to suggest().
+        """
+        if not text:
+            return None
+        q = text.lower()
+        if len(q) < 3:
+            return [self._names[sid] for sid, lower in enumerate(self._lowers) if q in lower]
+        grams = [self._literal_grams.get(q[i:i + 3], set()) for i in range(len(q) - 2)]
+        candidates = set.intersection(*sorted(grams, key=len))
+        return [self._names[sid] for sid in sorted(candidates) if q in self._lowers[sid]]
+
+    def _fuzzy(self, q):
+        q_grams = trigrams(q)
+        counts = {}
+        for g in q_grams:
+            for sid in self._grams.get(g, ()):
+                counts[sid] = counts.get(sid, 0) + 1
+        scored = []
+        for sid, shared in counts.items():
+            if shared / float(len(q_grams)) < self.fuzzy_threshold:
+                continue
+            sim = self._similarity(q_grams, sid)
+            if sim >= self.fuzzy_threshold:
+                scored.append((sid, sim))
+        scored.sort(key=lambda item: -item[1])
+        return scored
+
+    def suggest(self, text, limit=10):
+        """
+        Ranked typeahead: exact > whole-name prefix > word prefix > substring > fuzzy.
+        Returns [{"id", "name", "score"}].
+        """
+        q = normalize(text)
+        if not q:
+            return []
+        scores = {}
+        for sid in self._exact.get(q, ()):
+            scores[sid] = 4.0
+        for sid, whole in self._prefix_ids(q).items():
+            scores.setdefault(sid, 3.0 if whole else 2.0)
+        for sid in self._substring_ids(q):
+            scores.setdefault(sid, 1.0)
+        if len(scores) < limit:
+            for sid, sim in self._fuzzy(q):
+                scores.setdefault(sid, sim)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], len(self._names[item[0]]), self._names[item[0]]))
+        return [{"id": sid, "name": self._names[sid], "score": round(score, 3)} for sid, score in ranked[:limit]]
@@ -0,0 +1,33 @@
+from arrival_board import ArrivalIndex
+
+
+class _Route:
+    """Two-stop route geometry: just what ArrivalIndex.on_fix reads."""
+    stop_ids = [1, 2]
+    cum_km = [0.0, 5.0]
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+
+def _board_with_prediction(eta_minutes, seen_at):
+    index = ArrivalIndex(live_max_age=3600, overdue_grace=120)
+    index.build([(1, 1, "A", 0.0, 0.0), (2, 1, "B", 0.0, 0.0)], [(1, "28A")], [])
+    pos = {"service_no": "28A", "vehicle_id": 1, "updated_at": "2026-01-01T08:00:00"}
+    index.on_fix(pos, _Route(), 0, 0.0, lambda *args: (eta_minutes, "live"))
+    for preds in index._live.values():
+        preds["28A"]["seen_at"] = seen_at
+    return index
+
+
+def test_live_eta_counts_down_from_the_fix():
+    index = _board_with_prediction(10, seen_at=1_000_000.0)
+    etas = [index.arrivals([2], now=1_000_000.0 + minutes * 60)[0]["eta_minutes"]
+            for minutes in (0, 0.2, 3, 6, 10)]
+    assert etas == [10, 10, 7, 4, 0]
+
+
+def test_overdue_prediction_is_dropped():
+    index = _board_with_prediction(10, seen_at=1_000_000.0)
+    assert index.arrivals([2], now=1_000_000.0 + 10 * 60 + 119)
+    assert index.arrivals([2], now=1_000_000.0 + 10 * 60 + 121) == []
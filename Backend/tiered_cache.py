@@ -0,0 +1,124 @@
+import os
+import threading
+
+from flask_caching.backends.base import BaseCache
+from flask_caching.backends.filesystemcache import FileSystemCache
+from flask_caching.backends.simplecache import SimpleCache
+
+LOCAL_PREFIX = "local:"
+
+
+class TieredCache(BaseCache):
+    """
+    flask_caching backend: a per-process SimpleCache (L1) in front of an
+    optional FileSystemCache (L2) shared by every worker on the host.
+
+    Reads try L1, then L2 (promoting the value into L1); writes go to both.
+    Keys starting with "local:" hold process-local state and never reach L2.
+    Without a cache_dir it behaves like SimpleCache, plus the counters.
+
+    Shared keys must carry their own invalidation (the data versions in
+    backend.versioned_cache): an L1 entry is only dropped by its TTL, capped
+    at l1_timeout.
+
+    Hits and misses are counted per key family — the endpoint name for
+    "view:<endpoint>:..." keys, else the text before the first colon.
+    """
+
+    def __init__(self, cache_dir=None, l1_timeout=60, threshold=500, default_timeout=300, ignore_errors=False):
+        super().__init__(default_timeout)
+        self.l1_timeout = l1_timeout
+        self.l1 = SimpleCache(threshold=threshold, default_timeout=default_timeout, ignore_errors=ignore_errors)
+        self.l2 = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.l2 = FileSystemCache(cache_dir, threshold=threshold * 4, default_timeout=default_timeout,
+                                      ignore_errors=ignore_errors)
+        self._lock = threading.Lock()
+        self._stats = {}           # family -> {"l1": n, "l2": n, "miss": n}
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            cache_dir=config.get("CACHE_DIR"),
+            l1_timeout=config.get("CACHE_L1_TIMEOUT", 60),
+            threshold=config["CACHE_THRESHOLD"],
+            ignore_errors=config["CACHE_IGNORE_ERRORS"]
+        )
+        return cls(*args, **kwargs)
+
+    # ── Counters ──
+    @staticmethod
+    def family(key):
+        parts = key.split(":", 2)
+        if parts[0] == "local" and len(parts) > 1:
+            parts = parts[1:]
+        if parts[0] == "view" and len(parts) > 1:
+            return parts[1]
+        return parts[0]
+
+    def _count(self, key, outcome):
+        family = self.family(key)
+        with self._lock:
+            counts = self._stats.get(family)
+            if counts is None:
+                counts = self._stats[family] = {"l1": 0, "l2": 0, "miss": 0}
+            counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for family, counts in self._stats.items():
+                total = counts["l1"] + counts["l2"] + counts["miss"]
+                out[family] = dict(counts, hit_ratio=round((total - counts["miss"]) / total, 3) if total else None)
+            return out
+
+    # ── BaseCache ──
+    def _shared(self, key):
+        return self.l2 is not None and not key.startswith(LOCAL_PREFIX)
+
+    def _l1_timeout(self, key, timeout):
+        timeout = self._normalize_timeout(timeout)
+        if not self._shared(key):
+            return timeout
+        return min(timeout, self.l1_timeout) if timeout else self.l1_timeout
+
+    def get(self, key):
+        value = self.l1.get(key)
+        if value is not None:
+            self._count(key, "l1")
+            return value
+        if self._shared(key):
+            value = self.l2.get(key)
+            if value is not None:
+                self.l1.set(key, value, timeout=self.l1_timeout)
+                self._count(key, "l2")
+                return value
+        self._count(key, "miss")
+        return None
+
+    def set(self, key, value, timeout=None):
+        ok = self.l1.set(key, value, timeout=self._l1_timeout(key, timeout))
+        if self._shared(key):
+            ok = self.l2.set(key, value, timeout=timeout)
+        return ok
+
+    def add(self, key, value, timeout=None):
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def has(self, key):
+        return self.l1.has(key) or (self._shared(key) and self.l2.has(key))
+
+    def delete(self, key):
+        deleted = self.l1.delete(key)
+        if self._shared(key):
+            deleted = self.l2.delete(key) or deleted
+        return deleted
+
+    def clear(self):
+        self.l1.clear()
+        if self.l2 is not None:
+            self.l2.clear()
+        return True
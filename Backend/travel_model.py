@@ -0,0 +1,186 @@
+import threading
+import time
+from array import array
+
+from geo import nearest_points
+
+
+def time_bucket(epoch_s, bucket_minutes):
+    """(weekday 0=Mon, bucket index within the day) in server local time."""
+    lt = time.localtime(epoch_s)
+    return lt.tm_wday, (lt.tm_hour * 60 + lt.tm_min) // bucket_minutes
+
+
+def aggregate_segment_times(fix_log, days, vehicle_routes, geometries, bucket_minutes=60, stop_radius_km=0.15,
+                            pause=None):
+    """
+    Turn recorded fixes into stop-to-stop travel time samples.
+
+    A bus "arrives" at a stop with the first fix within stop_radius_km of it.
+    Every arrival at stop i followed directly by an arrival at stop i+1 yields
+    one sample for that pair of stops in the weekday/time bucket of the first
+    arrival. Segments are named by stop_id, so samples outlive stop edits.
+
+    Each day partition is matched to its route's stops with one batch
+    nearest_points call; pause(), if given, runs after every partition so a
+    long aggregation can yield to other greenlets.
+
+    vehicle_routes: {vehicle_id: route_id}; geometries: {route_id: RouteGeometry}
+    Returns {(route_id, from_stop_id, to_stop_id, weekday, bucket): [count, total_seconds]}.
+    """
+    samples = {}
+    for day in days:
+        for vehicle_id in fix_log.vehicles(day):
+            route_id = vehicle_routes.get(vehicle_id)
+            geom = geometries.get(route_id)
+            if not geom or len(geom) < 2:
+                continue
+            fixes = fix_log.read_day(day, vehicle_id)
+            if not fixes:
+                continue
+            indices, dists = nearest_points([f[1] for f in fixes], [f[2] for f in fixes], geom.lats, geom.lngs)
+            prev = None  # (stop_idx, arrival_s)
+            for (ts, _, _, _), idx, dist in zip(fixes, indices, dists):
+                idx = int(idx)
+                if dist > stop_radius_km or (prev and prev[0] == idx):
+                    continue
+                arrival = ts / 1000.0
+                if prev and idx == prev[0] + 1:
+                    elapsed = arrival - prev[1]
+                    if 10 <= elapsed <= 7200:
+                        weekday, bucket = time_bucket(prev[1], bucket_minutes)
+                        segment = (route_id, geom.stop_ids[prev[0]], geom.stop_ids[idx], weekday, bucket)
+                        entry = samples.setdefault(segment, [0, 0.0])
+                        entry[0] += 1
+                        entry[1] += elapsed
+                prev = (idx, arrival)
+            if pause:
+                pause()
+    return samples
+
+
+def merge_samples(parts):
+    """Sum several aggregate_segment_times() results."""
+    merged = {}
+    for part in parts:
+        for key, (count, total) in part.items():
+            entry = merged.setdefault(key, [0, 0.0])
+            entry[0] += count
+            entry[1] += total
+    return merged
+
+
+class TravelTimeModel:
+    """
+    Historical stop-to-stop travel times, precomputed into cumulative arrays.
+
+    For every (route_id, weekday, bucket) with any history there is an array
+    cum_sec where cum_sec[j] - cum_sec[i] is the expected travel time from stop
+    i to stop j — the same trick RouteGeometry uses for distances, so a lookup
+    is one dict get and a subtraction.
+
+    Segment times come from the bucket's own samples when it has at least
+    min_samples, then the segment's all-day mean, then the segment distance at
+    the route's historical average speed.
+
+    Samples are kept by stop_id; a route's arrays are built for the geometry
+    they are queried with and rebuilt when its stop sequence changes, so stop
+    edits never leave them indexed by stale stop positions.
+    """
+
+    def __init__(self, bucket_minutes=60, min_samples=3):
+        self.bucket_minutes = bucket_minutes
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = {}         # route_id -> {(from_stop_id, to_stop_id): {(weekday, bucket): [count, total]}}
+        self._speed = {}           # route_id -> historical average km/s
+        self._tables = {}          # route_id -> (stop_ids, {(weekday, bucket): array('d') cumulative seconds})
+        self.built_at = None
+        self.sample_count = 0
+        self.table_count = 0
+
+    def build(self, samples, geometries):
+        by_route = {}
+        route_totals = {}          # route_id -> [km, seconds]
+        positions = {rid: {sid: i for i, sid in enumerate(geom.stop_ids)} for rid, geom in geometries.items() if geom}
+        for (route_id, from_id, to_id, weekday, bucket), (count, total) in samples.items():
+            by_route.setdefault(route_id, {}).setdefault((from_id, to_id), {})[(weekday, bucket)] = (count, total)
+            pos = positions.get(route_id, {})
+            i, j = pos.get(from_id), pos.get(to_id)
+            if i is not None and j is not None and i < j:
+                rt = route_totals.setdefault(route_id, [0.0, 0.0])
+                rt[0] += geometries[route_id].distance_between(i, j) * count
+                rt[1] += total
+
+        speed = {rid: km / sec for rid, (km, sec) in route_totals.items() if sec > 0 and km > 0}
+
+        with self._lock:
+            self._samples = by_route
+            self._speed = speed
+            self._tables = {}
+            self.built_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            self.sample_count = sum(count for count, _ in samples.values())
+            self.table_count = len({(rid, key) for rid, segments in by_route.items() if rid in speed
+                                    for buckets in segments.values() for key in buckets})
+
+    def _route_tables(self, geom):
+        """The route's cumulative arrays for geom's stop sequence, rebuilt if the stops changed."""
+        entry = self._tables.get(geom.route_id)
+        if entry is not None and (entry[0] is geom.stop_ids or entry[0] == geom.stop_ids):
+            return entry[1]
+
+        segments = self._samples.get(geom.route_id, {})
+        speed = self._speed.get(geom.route_id)
+        tables = {}
+        if speed and len(geom) >= 2:
+            pairs = [(geom.stop_ids[i], geom.stop_ids[i + 1]) for i in range(len(geom) - 1)]
+            overall = {}
+            for pair in pairs:
+                buckets = segments.get(pair)
+                if buckets:
+                    overall[pair] = (sum(c for c, _ in buckets.values()), sum(t for _, t in buckets.values()))
+            keys = {key for buckets in segments.values() for key in buckets}
+            for key in keys:
+                cum = array('d', [0.0] * len(geom))
+                for seg, pair in enumerate(pairs):
+                    own = segments.get(pair, {}).get(key)
+                    if own and own[0] >= self.min_samples:
+                        seconds = own[1] / own[0]
+                    elif pair in overall:
+                        seconds = overall[pair][1] / overall[pair][0]
+                    else:
+                        seconds = geom.distance_between(seg, seg + 1) / speed
+                    cum[seg + 1] = cum[seg] + seconds
+                tables[key] = cum
+        with self._lock:
+            self._tables[geom.route_id] = (geom.stop_ids, tables)
+        return tables
+
+    def invalidate(self, route_id=None):
+        """Drop built arrays (one route's or all); they are rebuilt from the samples on the next query."""
+        with self._lock:
+            if route_id is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(route_id, None)
+
+    def remaining_seconds(self, geom, closest_idx, dest_idx, dist_to_closest_km, when=None):
+        """
+        Expected seconds from the bus to dest_idx on geom, or None without
+        history for this route at this weekday/time. The leg to the closest
+        stop uses the route's average historical speed.
+        """
+        weekday, bucket = time_bucket(when or time.time(), self.bucket_minutes)
+        cum = self._route_tables(geom).get((weekday, bucket))
+        if cum is None:
+            return None
+        return dist_to_closest_km / self._speed[geom.route_id] + (cum[dest_idx] - cum[closest_idx])
+
+    def stats(self):
+        return {
+            "built_at": self.built_at,
+            "samples": self.sample_count,
+            "tables": self.table_count,
+            "routes": len(self._speed),
+            "bucket_minutes": self.bucket_minutes
+        }